@@ -1,8 +1,8 @@
 import os
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.orm import declarative_base, sessionmaker
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -10,4 +10,38 @@ if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL environment variable is not set")
 
 Base = declarative_base()
-engine = create_engine(DATABASE_URL)
+# One pool shared by every session; pre-ping drops connections the server
+# closed while idle, recycle retires them before proxies time them out.
+# LIFO checkout keeps reusing the warmest connections and lets surplus ones
+# sit idle long enough to be recycled. Sizes can be tuned per deployment.
+# SQLite (local/test runs) keeps its default pool, which takes no sizing.
+engine_options: dict = {"pool_pre_ping": True}
+if make_url(DATABASE_URL).get_backend_name() != "sqlite":
+    engine_options.update(
+        pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "3600")),
+        pool_use_lifo=True,
+    )
+engine = create_engine(DATABASE_URL, **engine_options)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def create_tables():
+    """
+    Create every table registered on Base. The ORM modules must be imported
+    first so their models are part of the metadata.
+    """
+    Base.metadata.create_all(bind=engine)
+
+
+def get_db():
+    """
+    Yield a session for the duration of a request, closing it afterwards.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
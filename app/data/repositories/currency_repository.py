@@ -1,12 +1,9 @@
 from datetime import datetime, timedelta
 
 from sqlalchemy import Column, Date, Float
-from sqlalchemy.orm import sessionmaker
 
 from app.data.base import Base, engine
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
 
 class CurrencyRatesORM(Base):
     __tablename__ = "currency_rates"
@@ -1,7 +1,8 @@
 # app/data/repository.py
 import json
 from datetime import datetime, timedelta
-from typing import List
+from functools import lru_cache
+from typing import Dict, Iterator, List
 
 from sqlalchemy import Column, Date, DateTime
 from sqlalchemy import Enum as SAEnum
@@ -14,18 +15,17 @@ from sqlalchemy import (
     asc,
     case,
     cast,
+    column,
     desc,
     func,
     or_,
+    values,
 )
-from sqlalchemy.orm import sessionmaker
 
-from app.data.base import Base, engine
+from app.data.base import Base
 from app.data.repositories.currency_repository import CurrencyRatesORM
 from app.domain.models.payment import Payment, PaymentSource, PaymentType
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
 
 class PaymentORM(Base):
     __tablename__ = "payments"
@@ -72,10 +72,6 @@ def payment_currency_rate_columns():
     }
 
 
-def create_payment_tables():
-    Base.metadata.create_all(bind=engine)
-
-
 def payment_to_domain(payment_orm: PaymentORM) -> Payment:
     return Payment(
         id=payment_orm.id,
@@ -92,37 +88,60 @@ def payment_to_domain(payment_orm: PaymentORM) -> Payment:
     )
 
 
-def get_all_payments(
-    db,
-    user_id: int,
-    currency: str | None = None,
-    page: int = 1,
-    page_size: int = 50,
-    search: str | None = None,
-    sort_field: str = "date",
-    sort_direction: str = "desc",
-) -> tuple[list[Payment], int]:
+# Sortable list fields (as sent by the frontend) -> column
+_SORT_COLUMNS = {
+    "id": PaymentORM.id,
+    "date": PaymentORM.date,
+    "amount": PaymentORM.amount,
+    "currency": PaymentORM.currency,
+    "merchant": PaymentORM.merchant,
+    "auto_category": PaymentORM.auto_category,
+    "source": PaymentORM.source,
+    "type": PaymentORM.type,
+    "note": PaymentORM.note,
+    "cust_category": PaymentORM.category,
+    "category": PaymentORM.category,
+}
+
+# Columns matched by the list search box
+_SEARCH_COLUMNS = (
+    PaymentORM.merchant,
+    PaymentORM.auto_category,
+    PaymentORM.category,
+    PaymentORM.note,
+    PaymentORM.currency,
+    cast(PaymentORM.type, Text),
+    cast(PaymentORM.source, Text),
+)
+
+_LIKE_ESCAPES = str.maketrans({"\\": "\\\\", "%": "\\%", "_": "\\_"})
+
+
+def _filtered_payments_query(db, user_id: int, search: str | None = None):
     query = db.query(PaymentORM).filter(PaymentORM.user_id == user_id)
     if search:
-        term = f"%{search.lower()}%"
+        # Match the text literally, wildcards typed by the user included
+        term = f"%{search.lower().translate(_LIKE_ESCAPES)}%"
         query = query.filter(
-            or_(
-                PaymentORM.merchant.ilike(term),
-                PaymentORM.auto_category.ilike(term),
-                PaymentORM.category.ilike(term),
-                PaymentORM.note.ilike(term),
-                PaymentORM.currency.ilike(term),
-                cast(PaymentORM.type, Text).ilike(term),
-                cast(PaymentORM.source, Text).ilike(term),
-            )
+            or_(*(column.ilike(term, escape="\\") for column in _SEARCH_COLUMNS))
         )
-    total = query.count()
+    return query
 
-    # Map 'cust_category' to the correct database column
-    if sort_field == "cust_category":
-        sort_column = PaymentORM.category
-    else:
-        sort_column = getattr(PaymentORM, sort_field, PaymentORM.date)
+
+def _converted_payments_query(
+    query,
+    currency: str | None = None,
+    sort_field: str = "date",
+    sort_direction: str = "desc",
+):
+    """
+    Sort the filtered payments query and select its rows with the amount
+    converted to the target currency (CNY if none is given).
+    Returns (rows_query, currency of the converted amounts).
+    """
+    sort_column = _SORT_COLUMNS.get(sort_field)
+    if sort_column is None:
+        raise ValueError(f"Invalid sort field: {sort_field}")
 
     # Apply sorting
     sort_order = desc if sort_direction == "desc" else asc
@@ -177,41 +196,7 @@ def get_all_payments(
                 *when_clauses, else_=PaymentORM.amount * target_rate_column
             )
 
-            payments = (
-                query.with_entities(
-                    PaymentORM.id,
-                    PaymentORM.date,
-                    converted_amount.label("amount"),
-                    PaymentORM.currency,
-                    PaymentORM.merchant,
-                    PaymentORM.auto_category,
-                    PaymentORM.source,
-                    PaymentORM.type,
-                    PaymentORM.note,
-                    PaymentORM.category,
-                    PaymentORM.user_id,
-                )
-                .offset((page - 1) * page_size)
-                .limit(page_size)
-                .all()
-            )
-
-            return [
-                Payment(
-                    id=p[0],
-                    date=p[1],
-                    amount=p[2],
-                    currency=currency,
-                    merchant=p[4],
-                    auto_category=p[5],
-                    source=p[6],
-                    type=p[7],
-                    note=p[8],
-                    category=p[9],
-                    user_id=p[10],
-                )
-                for p in payments
-            ], total
+            return _payment_row_entities(query, converted_amount), currency
 
     # fallback (no target currency specified - convert everything to CNY)
     query = query.join(
@@ -235,71 +220,141 @@ def get_all_payments(
     # Default: treat as CNY if currency not recognized
     converted_amount = case(*when_clauses, else_=PaymentORM.amount)
 
+    return _payment_row_entities(query, converted_amount), "CNY"
+
+
+def _payment_row_entities(query, converted_amount):
+    return query.with_entities(
+        PaymentORM.id,
+        PaymentORM.date,
+        converted_amount.label("amount"),
+        PaymentORM.currency,
+        PaymentORM.merchant,
+        PaymentORM.auto_category,
+        PaymentORM.source,
+        PaymentORM.type,
+        PaymentORM.note,
+        PaymentORM.category,
+        PaymentORM.user_id,
+    )
+
+
+def _row_to_payment(p, currency: str) -> Payment:
+    return Payment(
+        id=p[0],
+        date=p[1],
+        amount=p[2],
+        currency=currency,
+        merchant=p[4],
+        auto_category=p[5],
+        source=p[6],
+        type=p[7],
+        note=p[8],
+        category=p[9],
+        user_id=p[10],
+    )
+
+
+def get_all_payments(
+    db,
+    user_id: int,
+    currency: str | None = None,
+    page: int = 1,
+    page_size: int = 50,
+    search: str | None = None,
+    sort_field: str = "date",
+    sort_direction: str = "desc",
+) -> tuple[list[Payment], int]:
+    query = _filtered_payments_query(db, user_id, search)
+    rows_query, result_currency = _converted_payments_query(
+        query, currency, sort_field, sort_direction
+    )
+    # The window count rides along with the page rows, saving a COUNT query
     payments = (
-        query.with_entities(
-            PaymentORM.id,
-            PaymentORM.date,
-            converted_amount.label("amount"),
-            PaymentORM.currency,
-            PaymentORM.merchant,
-            PaymentORM.auto_category,
-            PaymentORM.source,
-            PaymentORM.type,
-            PaymentORM.note,
-            PaymentORM.category,
-            PaymentORM.user_id,
-        )
+        rows_query.add_columns(func.count().over().label("total_rows"))
         .offset((page - 1) * page_size)
         .limit(page_size)
         .all()
     )
+    if payments:
+        total = payments[0].total_rows
+    else:
+        # Past the last page no row carries the count, ask for it directly
+        total = rows_query.order_by(None).count()
+    return [_row_to_payment(p, result_currency) for p in payments], total
 
-    return [
-        Payment(
-            id=p[0],
-            date=p[1],
-            amount=p[2],
-            currency="CNY",  # All converted to CNY
-            merchant=p[4],
-            auto_category=p[5],
-            source=p[6],
-            type=p[7],
-            note=p[8],
-            category=p[9],
-            user_id=p[10],
-        )
-        for p in payments
-    ], total
+
+def iter_payments(
+    db,
+    user_id: int,
+    currency: str | None = None,
+    sort_field: str = "date",
+    sort_direction: str = "desc",
+    batch_size: int = 1000,
+) -> Iterator[Payment]:
+    """
+    Iterate over all payments of a user without loading them at once.
+    Rows are fetched from a server-side cursor in batches of batch_size.
+    """
+    query = _filtered_payments_query(db, user_id)
+    rows_query, result_currency = _converted_payments_query(
+        query, currency, sort_field, sort_direction
+    )
+    for p in rows_query.yield_per(batch_size):
+        yield _row_to_payment(p, result_currency)
 
 
 def upsert_payments(db, payments: List[Payment], user_id: int) -> int:
-    count = 0
-    for p in payments:
-        exists = (
-            db.query(PaymentORM)
-            .filter_by(
-                date=p.date, amount=p.amount, merchant=p.merchant, user_id=user_id
-            )
-            .first()
+    """
+    Insert payments that don't exist yet (same date, amount and merchant).
+    """
+    return upsert_payment_batches(db, [payments], user_id)[0]
+
+
+def upsert_payment_batches(db, batches: List[List[Payment]], user_id: int) -> List[int]:
+    """
+    Insert several batches of payments in one transaction, skipping those
+    that already exist (same date, amount and merchant). Rows inserted by an
+    earlier batch count as existing for later ones, as if each batch were
+    upserted on its own. Existing keys are fetched in one query over the
+    combined date range instead of one lookup per payment.
+    Returns the number of inserted payments per batch.
+    """
+    dates = [p.date for batch in batches for p in batch]
+    if not dates:
+        return [0] * len(batches)
+    existing = set(
+        db.query(PaymentORM.date, PaymentORM.amount, PaymentORM.merchant)
+        .filter(
+            PaymentORM.user_id == user_id,
+            PaymentORM.date >= min(dates),
+            PaymentORM.date <= max(dates),
         )
-        if not exists:
-            db.add(
-                PaymentORM(
-                    date=p.date,
-                    amount=p.amount,
-                    currency=normalize_stored_currency(p.currency),
-                    merchant=p.merchant,
-                    auto_category=p.auto_category,
-                    source=p.source,
-                    type=p.type,
-                    note=p.note,
-                    category=p.category,
-                    user_id=user_id,
-                )
+        .all()
+    )
+    counts = []
+    for batch in batches:
+        new_rows = [
+            PaymentORM(
+                date=p.date,
+                amount=p.amount,
+                currency=normalize_stored_currency(p.currency),
+                merchant=p.merchant,
+                auto_category=p.auto_category,
+                source=p.source,
+                type=p.type,
+                note=p.note,
+                category=p.category,
+                user_id=user_id,
             )
-            count += 1
+            for p in batch
+            if (p.date, p.amount, p.merchant) not in existing
+        ]
+        existing.update((r.date, r.amount, r.merchant) for r in new_rows)
+        db.add_all(new_rows)
+        counts.append(len(new_rows))
     db.commit()
-    return count
+    return counts
 
 
 def add_payment(db, payment: Payment, user_id: int) -> Payment:
@@ -362,12 +417,24 @@ def update_merchant_categories(
     return updated
 
 
+# Max ids bound into one IN (...) list, keeps large deletes under
+# driver parameter limits
+_DELETE_CHUNK_SIZE = 1000
+
+
 def delete_payments_by_ids(db, ids: list, user_id: int) -> int:
-    deleted = (
-        db.query(PaymentORM)
-        .filter(PaymentORM.id.in_(ids), PaymentORM.user_id == user_id)
-        .delete(synchronize_session=False)
-    )
+    """
+    Delete the user's payments with the given ids in one transaction,
+    one DELETE per chunk of ids.
+    """
+    deleted = 0
+    for start in range(0, len(ids), _DELETE_CHUNK_SIZE):
+        chunk = ids[start : start + _DELETE_CHUNK_SIZE]
+        deleted += (
+            db.query(PaymentORM)
+            .filter(PaymentORM.id.in_(chunk), PaymentORM.user_id == user_id)
+            .delete(synchronize_session=False)
+        )
     db.commit()
     return deleted
 
@@ -431,7 +498,23 @@ def delete_all_user_data(db, user_id: int):
     db.commit()
 
 
+def _strip_tz(value):
+    if getattr(value, "tzinfo", None) is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+def _days_window(newest_payment, days: int):
+    """
+    Start and end of the window covering the last `days` calendar days up to
+    the newest payment; the window starts at midnight.
+    """
+    start = newest_payment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start - timedelta(days=days - 1), newest_payment
+
+
 def build_base_payment_filters(
+    db,
     user_id: int,
     start_date=None,
     end_date=None,
@@ -442,23 +525,21 @@ def build_base_payment_filters(
     """
     from app.domain.models.payment import PaymentType
 
+    # Payment dates are stored naive; drop any offset once, up front
+    start_date = _strip_tz(start_date)
+    end_date = _strip_tz(end_date)
+
     filters = [PaymentORM.user_id == user_id, PaymentORM.type != PaymentType.ABORT]
     if days is not None and days > 0:
         newest_payment = (
-            SessionLocal()
-            .query(func.max(PaymentORM.date))
+            db.query(func.max(PaymentORM.date))
             .filter(PaymentORM.user_id == user_id)
             .scalar()
         )
         if newest_payment:
-            start_date_calc = (
-                newest_payment.date()
-                if hasattr(newest_payment, "date")
-                else newest_payment
-            )
-            start_date_calc = start_date_calc - timedelta(days=days - 1)
+            start_date_calc, end_date_calc = _days_window(newest_payment, days)
             filters.append(PaymentORM.date >= start_date_calc)
-            filters.append(PaymentORM.date <= newest_payment)
+            filters.append(PaymentORM.date <= end_date_calc)
     else:
         if start_date:
             filters.append(PaymentORM.date >= start_date)
@@ -467,6 +548,53 @@ def build_base_payment_filters(
     return filters
 
 
+def _amount_expr(currency: str | None):
+    """
+    Payment amount converted to the target currency, or to CNY when no
+    currency is given or it is not supported. Needs CurrencyRatesORM joined
+    on the payment date.
+    """
+    currency_columns = payment_currency_rate_columns()
+    target_currency = "EURO" if currency == "EUR" else currency
+    if target_currency and hasattr(CurrencyRatesORM, target_currency):
+        target_rate_column = getattr(CurrencyRatesORM, target_currency)
+
+        # Build CASE statement: convert payment currency to CNY, then to target
+        when_clauses = []
+        for curr_name, source_rate_col in currency_columns.items():
+            if curr_name == "CNY":
+                # CNY to target: amount * target_rate
+                when_clauses.append(
+                    (
+                        PaymentORM.currency == curr_name,
+                        PaymentORM.amount * target_rate_column,
+                    )
+                )
+            else:
+                # Other to target: (amount / source_rate) * target_rate
+                when_clauses.append(
+                    (
+                        PaymentORM.currency == curr_name,
+                        PaymentORM.amount / source_rate_col * target_rate_column,
+                    )
+                )
+        return case(*when_clauses, else_=PaymentORM.amount * target_rate_column)
+
+    # Convert everything to CNY
+    when_clauses = []
+    for curr_name, source_rate_col in currency_columns.items():
+        if curr_name == "CNY":
+            when_clauses.append((PaymentORM.currency == curr_name, PaymentORM.amount))
+        else:
+            when_clauses.append(
+                (
+                    PaymentORM.currency == curr_name,
+                    PaymentORM.amount / source_rate_col,
+                )
+            )
+    return case(*when_clauses, else_=PaymentORM.amount)
+
+
 def sum_payments_in_db_range(
     db,
     user_id: int,
@@ -475,87 +603,75 @@ def sum_payments_in_db_range(
     currency: str | None = None,
     days: int | None = None,
 ) -> float:
-    filters = build_base_payment_filters(user_id, start, end, days)
-
-    # Join with currency rates table
-    query = (
-        db.query(PaymentORM)
+    filters = build_base_payment_filters(db, user_id, start, end, days)
+    total = (
+        db.query(func.sum(_amount_expr(currency)))
         .join(CurrencyRatesORM, PaymentORM.date.cast(Date) == CurrencyRatesORM.date)
         .filter(*filters)
+        .scalar()
     )
+    return total or 0.0
 
-    # Build currency conversion mapping
-    currency_columns = payment_currency_rate_columns()
-
-    if currency:
-        # Convert to target currency
-        target_currency = "EURO" if currency == "EUR" else currency
-        if hasattr(CurrencyRatesORM, target_currency):
-            target_rate_column = getattr(CurrencyRatesORM, target_currency)
 
-            # Build CASE statement: convert payment currency to CNY, then to target
-            when_clauses = []
-            for curr_name, source_rate_col in currency_columns.items():
-                if curr_name == "CNY":
-                    # CNY to target: amount * target_rate
-                    when_clauses.append(
-                        (
-                            PaymentORM.currency == curr_name,
-                            PaymentORM.amount * target_rate_column,
-                        )
-                    )
-                else:
-                    # Other to target: (amount / source_rate) * target_rate
-                    when_clauses.append(
-                        (
-                            PaymentORM.currency == curr_name,
-                            PaymentORM.amount / source_rate_col * target_rate_column,
-                        )
-                    )
-
-            amount_expr = case(
-                *when_clauses, else_=PaymentORM.amount * target_rate_column
-            )
-            total = query.with_entities(func.sum(amount_expr)).scalar()
-            return total or 0.0
-        else:
-            # Currency not supported, fallback to CNY conversion
-            when_clauses = []
-            for curr_name, source_rate_col in currency_columns.items():
-                if curr_name == "CNY":
-                    when_clauses.append(
-                        (PaymentORM.currency == curr_name, PaymentORM.amount)
-                    )
-                else:
-                    when_clauses.append(
-                        (
-                            PaymentORM.currency == curr_name,
-                            PaymentORM.amount / source_rate_col,
-                        )
-                    )
+def sum_payments_in_db_ranges(
+    db,
+    user_id: int,
+    ranges: Dict[str, tuple],
+    currency: str | None = None,
+) -> Dict[str, float]:
+    """
+    Sum payments for several named ranges in one query.
+    ranges maps name -> (start, end, days) with the same meaning as the
+    arguments of sum_payments_in_db_range. The ranges are sent as a VALUES
+    list joined against payments and grouped by name.
+    """
+    if not ranges:
+        return {}
+    newest_payment = None
+    if any(days is not None and days > 0 for _, _, days in ranges.values()):
+        newest_payment = (
+            db.query(func.max(PaymentORM.date))
+            .filter(PaymentORM.user_id == user_id)
+            .scalar()
+        )
 
-            amount_expr = case(*when_clauses, else_=PaymentORM.amount)
-            total = query.with_entities(func.sum(amount_expr)).scalar()
-            return total or 0.0
-    else:
-        # No target currency specified - convert everything to CNY
-        when_clauses = []
-        for curr_name, source_rate_col in currency_columns.items():
-            if curr_name == "CNY":
-                when_clauses.append(
-                    (PaymentORM.currency == curr_name, PaymentORM.amount)
-                )
+    rows = []
+    for name, (start, end, days) in ranges.items():
+        # Payment dates are stored naive, as in build_base_payment_filters
+        start, end = _strip_tz(start), _strip_tz(end)
+        if days is not None and days > 0:
+            if newest_payment:
+                start, end = _days_window(newest_payment, days)
             else:
-                when_clauses.append(
-                    (
-                        PaymentORM.currency == curr_name,
-                        PaymentORM.amount / source_rate_col,
-                    )
-                )
-
-        amount_expr = case(*when_clauses, else_=PaymentORM.amount)
-        total = query.with_entities(func.sum(amount_expr)).scalar()
-        return total or 0.0
+                start = end = None
+        # Open bounds become the widest timestamps so every row compares alike
+        rows.append((name, start or datetime.min, end or datetime.max))
+
+    range_table = values(
+        column("name", String),
+        column("start", DateTime),
+        column("end", DateTime),
+        name="ranges",
+    ).data(rows)
+    # Cast so string bounds from the request compare as timestamps
+    totals = (
+        db.query(range_table.c.name, func.sum(_amount_expr(currency)))
+        .select_from(range_table)
+        .join(
+            PaymentORM,
+            PaymentORM.date.between(
+                cast(range_table.c.start, DateTime), cast(range_table.c.end, DateTime)
+            ),
+        )
+        .join(CurrencyRatesORM, PaymentORM.date.cast(Date) == CurrencyRatesORM.date)
+        .filter(PaymentORM.user_id == user_id, PaymentORM.type != PaymentType.ABORT)
+        .group_by(range_table.c.name)
+        .all()
+    )
+    result = {name: 0.0 for name in ranges}
+    for name, total in totals:
+        result[name] = total or 0.0
+    return result
 
 
 def all_merchant_same_category_db(
@@ -587,6 +703,52 @@ def all_merchant_same_category_db(
     return total_count == category_count
 
 
+def _collect_paths(tree, path=None, paths=None):
+    """
+    Collect the path (list of names from the top) of every leaf category.
+    """
+    if tree is None:
+        return paths if paths is not None else []
+    if paths is None:
+        paths = []
+    if path is None:
+        path = []
+    for k, v in tree.items() if isinstance(tree, dict) else []:
+        current_path = path + [k]
+        if v is None:
+            paths.append(current_path)
+        elif isinstance(v, dict):
+            if not v:
+                paths.append(current_path)
+            else:
+                _collect_paths(v, current_path, paths)
+    return paths
+
+
+@lru_cache(maxsize=64)
+def _category_index_for(tree_json: str):
+    all_paths = [tuple(p) for p in _collect_paths(json.loads(tree_json))]
+    leaf_to_path = {p[-1]: p for p in all_paths}
+    name_to_path: dict[str, tuple[str, ...]] = {}
+    for path in leaf_to_path.values():
+        for name in path:
+            name_to_path.setdefault(name, path)
+    # Leaf matches win over parent matches
+    name_to_path.update(leaf_to_path)
+    all_cats = frozenset(cat for path in all_paths for cat in path)
+    return all_cats, name_to_path
+
+
+def _category_index(category_tree: dict):
+    """
+    Returns all category names in the tree and a map from every name to the
+    path its sums roll up along. A leaf maps to its own path, a parent to
+    the path of its first leaf.
+    Cached per tree content, callers must not mutate the returned map.
+    """
+    return _category_index_for(json.dumps(category_tree))
+
+
 def sum_payments_by_category_db(
     db,
     user_id: int,
@@ -600,123 +762,21 @@ def sum_payments_by_category_db(
     Aggregate payment amounts by category using the database layer.
     Returns: dict {category_name: sum, ...}, metadata
     """
-
-    # Build all leaf categories and their paths
-    def collect_paths(tree, path=None, paths=None):
-        if tree is None:
-            return paths if paths is not None else []
-        if paths is None:
-            paths = []
-        if path is None:
-            path = []
-        for k, v in tree.items() if isinstance(tree, dict) else []:
-            current_path = path + [k]
-            if v is None:
-                paths.append(current_path)
-            elif isinstance(v, dict):
-                if not v:
-                    paths.append(current_path)
-                else:
-                    collect_paths(v, current_path, paths)
-        return paths
-
-    all_paths = collect_paths(category_tree)
-    leaf_to_path = {p[-1]: p for p in all_paths}
-    all_cats = set(cat for path in all_paths for cat in path)
+    all_cats, name_to_path = _category_index(category_tree)
 
     # Build base query
-    filters = build_base_payment_filters(user_id, start_date, end_date, days)
-
-    currency_columns = payment_currency_rate_columns()
-
-    # Currency conversion
-    if currency:
-        target_currency = "EURO" if currency == "EUR" else currency
-        if hasattr(CurrencyRatesORM, target_currency):
-            target_rate_column = getattr(CurrencyRatesORM, target_currency)
-
-            # Build CASE statement: convert payment currency to CNY, then to target
-            when_clauses = []
-            for curr_name, source_rate_col in currency_columns.items():
-                if curr_name == "CNY":
-                    # CNY to target: amount * target_rate
-                    when_clauses.append(
-                        (
-                            PaymentORM.currency == curr_name,
-                            PaymentORM.amount * target_rate_column,
-                        )
-                    )
-                else:
-                    # Other to target: (amount / source_rate) * target_rate
-                    when_clauses.append(
-                        (
-                            PaymentORM.currency == curr_name,
-                            PaymentORM.amount / source_rate_col * target_rate_column,
-                        )
-                    )
+    filters = build_base_payment_filters(db, user_id, start_date, end_date, days)
 
-            amount_expr = case(
-                *when_clauses, else_=PaymentORM.amount * target_rate_column
-            )
-
-            query = db.query(
-                PaymentORM.category,
-                func.sum(amount_expr).label("sum"),
-            ).join(
-                CurrencyRatesORM, PaymentORM.date.cast(Date) == CurrencyRatesORM.date
-            )
-        else:
-            # Currency not supported, fallback to CNY conversion
-            when_clauses = []
-            for curr_name, source_rate_col in currency_columns.items():
-                if curr_name == "CNY":
-                    when_clauses.append(
-                        (PaymentORM.currency == curr_name, PaymentORM.amount)
-                    )
-                else:
-                    when_clauses.append(
-                        (
-                            PaymentORM.currency == curr_name,
-                            PaymentORM.amount / source_rate_col,
-                        )
-                    )
-
-            amount_expr = case(*when_clauses, else_=PaymentORM.amount)
-
-            query = db.query(
-                PaymentORM.category,
-                func.sum(amount_expr).label("sum"),
-            ).join(
-                CurrencyRatesORM, PaymentORM.date.cast(Date) == CurrencyRatesORM.date
-            )
-    else:
-        # No target currency - convert everything to CNY
-        when_clauses = []
-        for curr_name, source_rate_col in currency_columns.items():
-            if curr_name == "CNY":
-                when_clauses.append(
-                    (PaymentORM.currency == curr_name, PaymentORM.amount)
-                )
-            else:
-                when_clauses.append(
-                    (
-                        PaymentORM.currency == curr_name,
-                        PaymentORM.amount / source_rate_col,
-                    )
-                )
-
-        amount_expr = case(*when_clauses, else_=PaymentORM.amount)
-
-        query = db.query(
-            PaymentORM.category,
-            func.sum(amount_expr).label("sum"),
-        ).join(CurrencyRatesORM, PaymentORM.date.cast(Date) == CurrencyRatesORM.date)
+    query = db.query(
+        PaymentORM.category,
+        func.sum(_amount_expr(currency)).label("sum"),
+    ).join(CurrencyRatesORM, PaymentORM.date.cast(Date) == CurrencyRatesORM.date)
 
     query = query.filter(*filters).group_by(PaymentORM.category)
     rows = query.all()
 
     # Prepare result dict for all categories
-    result = {cat: 0.0 for cat in all_cats}
+    result = dict.fromkeys(all_cats, 0.0)
     result["no category"] = 0.0
     result["invalid category"] = 0.0
     total_sum = 0.0
@@ -730,13 +790,7 @@ def sum_payments_by_category_db(
             result["no category"] += s
             total_sum += s
             continue
-        path = leaf_to_path.get(cat_key)
-        if not path:
-            # Try partial match (for parent categories)
-            for k, v in leaf_to_path.items():
-                if cat_key == k or cat_key in v:
-                    path = v
-                    break
+        path = name_to_path.get(cat_key)
         if not path:
             result["invalid category"] += s
             invalid_categories_set.add(cat_key)
@@ -746,11 +800,12 @@ def sum_payments_by_category_db(
             result[cat_in_path] += s
         total_sum += s
 
-    # Round all sums to zero decimal places
-    for key in result:
-        result[key] = round(result[key])
-
-    output = {k: -v for k, v in result.items() if v != 0.0}
+    # Round sums to whole units and drop those that round to zero, in one pass
+    output = {}
+    for key, value in result.items():
+        rounded = round(value)
+        if rounded != 0:
+            output[key] = -rounded
     metadata = {
         "Total Expenses": round(total_sum),
         "invalid categories": sorted(list(invalid_categories_set)),
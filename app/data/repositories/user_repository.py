@@ -1,9 +1,6 @@
 from sqlalchemy import Column, Integer, String
-from sqlalchemy.orm import sessionmaker
 
-from app.data.base import Base, engine
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+from app.data.base import Base
 
 
 class UserORM(Base):
@@ -13,10 +10,6 @@ class UserORM(Base):
     hashed_password = Column(String, nullable=False)
 
 
-def create_user_table():
-    Base.metadata.create_all(bind=engine)
-
-
 def get_user_by_username(db, username: str):
     return db.query(UserORM).filter(UserORM.username == username).first()
 
@@ -1,4 +1,10 @@
-from app.data.base import Base
-from app.data.repositories.payment_repository import engine
+# Creates all tables; run with `python -m app.data.setup_db`
+from app.data.base import create_tables
+from app.data.repositories import (  # noqa: F401  register the ORM models
+    currency_repository,
+    payment_repository,
+    user_repository,
+)
 
-Base.metadata.create_all(bind=engine)
+if __name__ == "__main__":
+    create_tables()
@@ -1,118 +1,62 @@
-def build_sankey_data(result: dict, metadata: dict, category_tree: dict):
+def _node_index(name: str, value, nodes: list, node_map: dict) -> int:
     """
-    Build Sankey diagram nodes and links from aggregation result and category tree.
-    Exclude nodes with value 0 and links to/from such nodes.
-    If a node has a negative value, create a link from child to parent.
+    Index of the node for name, appending it on first use.
     """
-    nodes = []
-    node_map: dict = {}  # Add type annotation
-    idx = 0
-
-    def add_node(name):
-        nonlocal idx
-        if name in node_map:
-            return node_map[name]
-        value = 0
-        if name == "Total Expenses":
-            value = metadata["Total Expenses"]
-        elif name in result:
-            value = result[name]
+    idx = node_map.get(name)
+    if idx is None:
+        idx = node_map[name] = len(nodes)
         nodes.append({"name": name, "value": value})
-        node_map[name] = idx
-        idx += 1
-        return node_map[name]
+    return idx
 
-    add_node("Total Expenses")
 
-    links = []
+def _append_link(links: list, parent_idx: int, child_idx: int, value) -> None:
+    # Positive values flow from parent to child, negative ones back up
+    if value > 0:
+        links.append({"source": parent_idx, "target": child_idx, "value": value})
+    else:
+        links.append({"source": child_idx, "target": parent_idx, "value": abs(value)})
 
-    def traverse(tree, parent):
-        if tree is None:
-            return
-        for k, v in tree.items() if isinstance(tree, dict) else []:
-            add_node(k)
-            value = result.get(k, 0)
-            if value > 0:
-                links.append(
-                    {"source": node_map[parent], "target": node_map[k], "value": value}
-                )
-            elif value < 0:
-                links.append(
-                    {
-                        "source": node_map[k],
-                        "target": node_map[parent],
-                        "value": abs(value),
-                    }
-                )
-            if isinstance(v, dict):
-                traverse(v, k)
 
-    for top_cat in category_tree or {}:
-        add_node(top_cat)
-        value = result.get(top_cat, 0)
-        if value > 0:
-            links.append(
-                {
-                    "source": node_map["Total Expenses"],
-                    "target": node_map[top_cat],
-                    "value": value,
-                }
-            )
-        elif value < 0:
-            links.append(
-                {
-                    "source": node_map[top_cat],
-                    "target": node_map["Total Expenses"],
-                    "value": abs(value),
-                }
-            )
-        traverse(category_tree[top_cat], top_cat)
+def build_sankey_data(result: dict, metadata: dict, category_tree: dict):
+    """
+    Build Sankey diagram nodes and links from aggregation result and category tree.
+    Exclude nodes with value 0 and links to/from such nodes.
+    If a node has a negative value, create a link from child to parent.
+    """
+    # Node values; links always use the raw result value
+    values = dict(result)
+    values["Total Expenses"] = metadata["Total Expenses"]
+
+    # Zero-valued nodes are never created, so indices are final as assigned
+    # and no filtering or index remapping pass is needed afterwards
+    nodes: list = []
+    node_map: dict = {}
+    links: list = []
+    if values["Total Expenses"] != 0:
+        _node_index("Total Expenses", values["Total Expenses"], nodes, node_map)
+
+    # Iterative preorder walk over (parent, name, subtree); children are
+    # pushed in reverse so they come off the stack in tree order
+    stack = [
+        ("Total Expenses", k, v) for k, v in reversed((category_tree or {}).items())
+    ]
+    while stack:
+        parent, name, subtree = stack.pop()
+        value = values.get(name, 0)
+        if value != 0:
+            idx = _node_index(name, value, nodes, node_map)
+            link_value = result.get(name, 0)
+            # A non-zero parent was visited first, so it already has a node
+            if link_value != 0 and values.get(parent, 0) != 0:
+                _append_link(links, node_map[parent], idx, link_value)
+        if isinstance(subtree, dict):
+            stack.extend((name, k, v) for k, v in reversed(subtree.items()))
 
     for special in ["no category", "invalid category"]:
         val = result.get(special, 0)
-        if val > 0:
-            add_node(special)
-            links.append(
-                {
-                    "source": node_map["Total Expenses"],
-                    "target": node_map[special],
-                    "value": val,
-                }
-            )
-        elif val < 0:
-            add_node(special)
-            links.append(
-                {
-                    "source": node_map[special],
-                    "target": node_map["Total Expenses"],
-                    "value": abs(val),
-                }
-            )
-
-    # Filter out nodes with value 0
-    filtered_nodes = [n for n in nodes if n["value"] != 0]
-    valid_names = set(n["name"] for n in filtered_nodes)
-    # Map node name to new index
-    name_to_new_idx = {n["name"]: i for i, n in enumerate(filtered_nodes)}
-
-    # Filter links to only those whose source and target are in valid_names
-    filtered_links = []
-    for link in links:
-        src_name = None
-        tgt_name = None
-        # Find names by old idx
-        for name, old_idx in node_map.items():
-            if old_idx == link["source"]:
-                src_name = name
-            if old_idx == link["target"]:
-                tgt_name = name
-        if src_name in valid_names and tgt_name in valid_names:
-            filtered_links.append(
-                {
-                    "source": name_to_new_idx[src_name],
-                    "target": name_to_new_idx[tgt_name],
-                    "value": link["value"],
-                }
-            )
+        if val != 0:
+            idx = _node_index(special, values[special], nodes, node_map)
+            if values["Total Expenses"] != 0:
+                _append_link(links, node_map["Total Expenses"], idx, val)
 
-    return {"nodes": filtered_nodes, "links": filtered_links}
+    return {"nodes": nodes, "links": links}
@@ -137,15 +137,12 @@ async def classify_payments_from_db(db: Session, user_id: int):
 if __name__ == "__main__":
     import argparse
 
-    from sqlalchemy.orm import sessionmaker
-
-    from app.data.base import engine
+    from app.data.base import SessionLocal
 
     parser = argparse.ArgumentParser(description="Classify payments from DB")
     parser.add_argument("--user_id", type=int, required=True, help="User ID")
     args = parser.parse_args()
 
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     db = SessionLocal()
     asyncio.run(classify_payments_from_db(db, args.user_id))
     db.close()
@@ -1,14 +1,12 @@
 import csv
 from datetime import datetime
 
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm import Session
 
-from app.data.base import engine
+from app.data.base import SessionLocal
 from app.data.repositories.payment_repository import upsert_payments
 from app.domain.models.payment import Payment, PaymentSource, PaymentType
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
 
 def parse_csv_payments(csv_path, user_id):
     payments = []
@@ -1,6 +1,3 @@
-from datetime import datetime
-from typing import List, Optional
-
 from app.domain.models.payment import Payment, PaymentType
 
 
@@ -12,20 +9,3 @@ def get_signed_amount(payment: Payment) -> float:
     if payment.type == PaymentType.ABORT:
         return 0.0
     return payment.amount
-
-
-def sum_payments_in_range(
-    payments: List[Payment], start: Optional[datetime], end: Optional[datetime]
-) -> float:
-    total = 0.0
-    # Convert start/end to date if provided
-    start_date = start.date() if start else None
-    end_date = end.date() if end else None
-    for p in payments:
-        p_date = p.date.date() if isinstance(p.date, datetime) else p.date
-        if start_date and p_date < start_date:
-            continue
-        if end_date and p_date > end_date:
-            continue
-        total += get_signed_amount(p)
-    return total
@@ -20,7 +20,9 @@ class PaymentType(Enum):
     REFUND = "refund"
 
 
-@dataclass
+# Slots keep per-instance memory down and attribute access fast; imports and
+# the in-memory sums build one instance per row
+@dataclass(slots=True)
 class Payment:
     date: datetime
     amount: float
@@ -5,4 +5,5 @@ from dataclasses import dataclass
 class User:
     id: int
     username: str
-    hashed_password: str
+    # Not set on users resolved from an access token
+    hashed_password: str | None = None
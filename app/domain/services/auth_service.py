@@ -1,24 +1,44 @@
+import logging
 import os
 import re
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
+from app.data.base import get_db
 from app.data.repositories.payment_repository import delete_all_user_data
 from app.data.repositories.user_repository import (
-    SessionLocal,
     create_user,
     delete_user,
     get_user_by_username,
     update_password,
     update_username,
 )
+from app.domain.models.user import User
+
+# New hashes use Argon2id; existing bcrypt hashes, and Argon2 hashes made
+# with other parameters, still verify and are upgraded on the next login.
+# The defaults are the OWASP minimum (19 MiB, 2 passes, 1 lane).
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=int(os.getenv("ARGON2_TIME_COST", "2")),
+    argon2__memory_cost=int(os.getenv("ARGON2_MEMORY_COST", "19456")),
+    argon2__parallelism=int(os.getenv("ARGON2_PARALLELISM", "1")),
+)
+logger = logging.getLogger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashing slower than this noticeably holds up logins and registrations
+_SLOW_HASH_SECONDS = 0.3
 SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
     raise RuntimeError("SECRET_KEY environment variable is not set")
@@ -28,13 +48,72 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Raw token -> (id/username snapshot, token expiry), so repeat requests skip the JWT
+# verify and the user lookup. Entries for a user are dropped whenever the
+# account changes, see _invalidate_user_tokens.
+_TOKEN_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+_TOKEN_CACHE_LOCK = threading.Lock()
+# Bumped on every invalidation. The user is looked up by username before
+# its id is known, so one counter covers all users: a lookup that overlaps
+# any account change simply isn't cached.
+_token_generation = 0
+
+
+def _invalidate_user_tokens(user_id: int) -> None:
+    global _token_generation
+    with _TOKEN_CACHE_LOCK:
+        _token_generation += 1
+        for token in [t for t, (u, _) in _TOKEN_CACHE.items() if u.id == user_id]:
+            _TOKEN_CACHE.pop(token, None)
+
+
+# Hashes running at once. Argon2 releases the GIL, so threads hash in
+# parallel; the bound caps memory (ARGON2_MEMORY_COST KiB per hash) and keeps
+# a burst of logins from occupying every threadpool worker.
+_HASH_SLOTS = threading.BoundedSemaphore(
+    int(os.getenv("MAX_CONCURRENT_HASHES", str(os.cpu_count() or 1)))
+)
+# Seconds a request waits for a free slot before it is turned away
+_HASH_SLOT_TIMEOUT = 2
+
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+class PasswordHashingBusyError(Exception):
+    """
+    Raised when no hashing slot frees up in time; endpoints answer 429.
+    """
+
+
+@contextmanager
+def _hash_slot():
+    if not _HASH_SLOTS.acquire(timeout=_HASH_SLOT_TIMEOUT):
+        raise PasswordHashingBusyError("Too many requests, please try again")
+    try:
+        yield
+    finally:
+        _HASH_SLOTS.release()
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    with _hash_slot():
+        return pwd_context.hash(password)
+
+
+def benchmark_password_hash() -> float:
+    """
+    Time one hash with the configured parameters and log it, with a warning
+    when it is slow enough to hurt request latency. Run once at startup.
+    """
+    start = time.perf_counter()
+    pwd_context.hash("benchmark password")
+    elapsed = time.perf_counter() - start
+    logger.info("Password hashing takes %.0f ms", elapsed * 1000)
+    if elapsed > _SLOW_HASH_SECONDS:
+        logger.warning(
+            "Password hashing is slower than %.0f ms, consider lowering "
+            "ARGON2_* costs",
+            _SLOW_HASH_SECONDS * 1000,
+        )
+    return elapsed
 
 
 def validate_and_normalize_username(username: str) -> str:
@@ -49,8 +128,17 @@ def validate_and_normalize_username(username: str) -> str:
 def authenticate_user(db: Session, username: str, password: str):
     username = validate_and_normalize_username(username)
     user = get_user_by_username(db, username)
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
+        # Spend the same hashing time as a wrong password would
+        with _hash_slot():
+            pwd_context.dummy_verify()
+        return None
+    with _hash_slot():
+        valid, new_hash = pwd_context.verify_and_update(password, user.hashed_password)
+    if not valid:
         return None
+    if new_hash:
+        update_password(db, user.id, new_hash)
     return user
 
 
@@ -63,7 +151,15 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+def get_current_user(
+    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+):
+    with _TOKEN_CACHE_LOCK:
+        cached = _TOKEN_CACHE.get(token)
+        generation = _token_generation
+    if cached is not None and cached[1] > time.time():
+        return cached[0]
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -77,31 +173,55 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
         username = validate_and_normalize_username(username)
     except (JWTError, ValueError):
         raise credentials_exception
-    db = SessionLocal()
+    # get_db is cached per request, so this is the endpoint's own session
     user = get_user_by_username(db, username)
-    db.close()
     if user is None:
         raise credentials_exception
+    # Cache a plain snapshot, the ORM instance is bound to this request's
+    # session. The password hash is left out, nothing downstream needs it.
+    user = User(id=user.id, username=user.username)
+    with _TOKEN_CACHE_LOCK:
+        # Skip the store if an account change ran during the lookup
+        if _token_generation == generation:
+            _TOKEN_CACHE[token] = (user, payload.get("exp", 0))
     return user
 
 
 def delete_user_account(db: Session, user_id: int):
     delete_all_user_data(db, user_id)
-    return delete_user(db, user_id)
+    deleted = delete_user(db, user_id)
+    _invalidate_user_tokens(user_id)
+    return deleted
 
 
 def change_username(db: Session, user_id: int, new_username: str):
     new_username = validate_and_normalize_username(new_username)
     if get_user_by_username(db, new_username):
         raise ValueError("Username already taken")
-    return update_username(db, user_id, new_username)
+    user = update_username(db, user_id, new_username)
+    _invalidate_user_tokens(user_id)
+    return user
 
 
 def change_password(db: Session, user_id: int, new_password: str):
     if len(new_password) < 8:
         raise ValueError("Password must be at least 8 characters long")
     hashed = get_password_hash(new_password)
-    return update_password(db, user_id, hashed)
+    user = update_password(db, user_id, hashed)
+    _invalidate_user_tokens(user_id)
+    return user
+
+
+def is_username_taken(db: Session, username: str) -> bool:
+    """
+    Returns True if the (normalized) username is already registered.
+    Invalid usernames return False; register_user reports why they are invalid.
+    """
+    try:
+        username = validate_and_normalize_username(username)
+    except ValueError:
+        return False
+    return get_user_by_username(db, username) is not None
 
 
 def register_user(db: Session, username: str, password: str):
@@ -1,13 +1,17 @@
+import asyncio
+import calendar
 import csv
 import io
 import os
 import shutil
 import tempfile
+import threading
 from datetime import datetime, timedelta
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, Iterator, List
 
+import orjson
 import requests
-from fastapi.responses import StreamingResponse
+from cachetools import TTLCache
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
@@ -21,7 +25,6 @@ from app.data.repositories.payment_repository import (
     PaymentORM,
     add_payment,
     all_merchant_same_category_db,
-    create_payment_tables,
 )
 from app.data.repositories.payment_repository import (
     delete_payments_by_ids as repo_delete_payments_by_ids,
@@ -29,10 +32,15 @@ from app.data.repositories.payment_repository import (
 from app.data.repositories.payment_repository import (
     get_all_child_categories,
     get_all_payments,
-    get_category_tree,
+)
+from app.data.repositories.payment_repository import (
+    get_category_tree as repo_get_category_tree,
+)
+from app.data.repositories.payment_repository import (
+    iter_payments,
     save_category_tree,
     sum_payments_by_category_db,
-    sum_payments_in_db_range,
+    sum_payments_in_db_ranges,
 )
 from app.data.repositories.payment_repository import (
     update_merchant_categories as repo_update_merchant_categories,
@@ -42,7 +50,7 @@ from app.data.repositories.payment_repository import (
 )
 from app.data.repositories.payment_repository import (
     update_payments_category_bulk,
-    upsert_payments,
+    upsert_payment_batches,
 )
 from app.domain.helpers.aggregation import build_sankey_data
 from app.domain.helpers.categorizer import (
@@ -51,11 +59,56 @@ from app.domain.helpers.categorizer import (
 )
 from app.domain.models.payment import Payment, PaymentSource, PaymentType
 
-create_payment_tables()
-
 # Replace existing SUPPORTED_CURRENCIES
 SUPPORTED_CURRENCIES = {"CNY", "EUR", "USD", "KRW", "JPY", "VND", "MYR", "HKD"}
 
+# Uploads are copied to disk in chunks of this size, never read whole
+_SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Sankey results keyed by (user_id, start, end, currency, days). The summary
+# cards and the aggregation dialog ask for the same ranges back to back.
+# Cleared per user on every write; the TTL bounds staleness for relative
+# "days" ranges and newly fetched exchange rates.
+_SANKEY_CACHE: TTLCache = TTLCache(maxsize=256, ttl=30)
+_SANKEY_CACHE_LOCK = threading.Lock()
+
+# Category tree per user, as a dict and as encoded JSON. The tree is read by
+# most requests but only changes through update_category_tree, which drops
+# both entries. Cached dicts are shared, callers must not mutate them.
+_TREE_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=60)
+_TREE_JSON_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=60)
+_TREE_CACHE_LOCK = threading.Lock()
+# Bumped per user on every invalidation. A reader only stores what it fetched
+# if the generation is unchanged, so a tree read while update_category_tree
+# runs can't be cached again after the update dropped it.
+_TREE_GENERATIONS: Dict[int, int] = {}
+
+
+def _invalidate_aggregates(user_id: int) -> None:
+    with _SANKEY_CACHE_LOCK:
+        for key in [k for k in _SANKEY_CACHE.keys() if k[0] == user_id]:
+            _SANKEY_CACHE.pop(key, None)
+
+
+def _invalidate_tree(user_id: int) -> None:
+    with _TREE_CACHE_LOCK:
+        _TREE_GENERATIONS[user_id] = _TREE_GENERATIONS.get(user_id, 0) + 1
+        _TREE_CACHE.pop(user_id, None)
+        _TREE_JSON_CACHE.pop(user_id, None)
+
+
+def get_category_tree(db: Session, user_id: int) -> Dict[str, Any]:
+    with _TREE_CACHE_LOCK:
+        cached = _TREE_CACHE.get(user_id)
+        generation = _TREE_GENERATIONS.get(user_id, 0)
+    if cached is not None:
+        return cached
+    tree = repo_get_category_tree(db, user_id)
+    with _TREE_CACHE_LOCK:
+        if _TREE_GENERATIONS.get(user_id, 0) == generation:
+            _TREE_CACHE[user_id] = tree
+    return tree
+
 
 def child_categories(db: Session, user_id: int) -> List[str]:
     tree = get_category_tree(db, user_id)
@@ -68,6 +121,22 @@ def _validate_category(db: Session, user_id: int, cust_category: str) -> None:
         raise ValueError(f"Invalid child category: {cust_category}")
 
 
+def get_category_tree_json(db: Session, user_id: int) -> bytes:
+    """
+    Return the user's category tree already encoded as JSON bytes.
+    """
+    with _TREE_CACHE_LOCK:
+        cached = _TREE_JSON_CACHE.get(user_id)
+        generation = _TREE_GENERATIONS.get(user_id, 0)
+    if cached is not None:
+        return cached
+    tree_json = orjson.dumps(get_category_tree(db, user_id))
+    with _TREE_CACHE_LOCK:
+        if _TREE_GENERATIONS.get(user_id, 0) == generation:
+            _TREE_JSON_CACHE[user_id] = tree_json
+    return tree_json
+
+
 def update_category_tree(new_tree: Dict[str, Any], db: Session, user_id: int) -> None:
     old_tree = get_category_tree(db, user_id)
     old_child_categories = set(get_all_child_categories(old_tree))
@@ -77,6 +146,8 @@ def update_category_tree(new_tree: Dict[str, Any], db: Session, user_id: int) ->
         # Efficient bulk update in DB layer for deleted categories
         update_payments_category_bulk(db, user_id, list(deleted_categories), "")
     save_category_tree(db, user_id, new_tree)
+    _invalidate_tree(user_id)
+    _invalidate_aggregates(user_id)
 
 
 def update_payment_category(
@@ -86,6 +157,7 @@ def update_payment_category(
     updated = repo_update_payment_category(db, payment_id, user_id, cust_category)
     if not updated:
         raise ValueError(f"Payment with id {payment_id} not found")
+    _invalidate_aggregates(user_id)
 
 
 def update_merchant_categories(
@@ -95,6 +167,7 @@ def update_merchant_categories(
     count = repo_update_merchant_categories(db, payment_id, user_id, cust_category)
     if count == 0:
         raise ValueError(f"Payment with id {payment_id} not found")
+    _invalidate_aggregates(user_id)
     return count
 
 
@@ -137,10 +210,13 @@ def _has_child_category(db: Session, user_id: int, category_name: str) -> bool:
     return any(c.lower() == category_name.lower() for c in (cats or []))
 
 
-def _import_payments_with_parser(
-    parser_func, source_filepath: str, db: Session, user_id: int
-) -> int:
-    payments = parser_func(source_filepath)
+def _prepare_imported_payments(
+    payments: List[Payment], db: Session, user_id: int
+) -> None:
+    """
+    Assign parsed payments to the user and auto-categorize them.
+    Raises ValueError when none of them carries a date.
+    """
     for p in payments:
         p.user_id = user_id
 
@@ -163,17 +239,9 @@ def _import_payments_with_parser(
         print(f"Error during auto-categorization: {e}")
         pass
 
-    # Determine earliest and latest payment dates
-    dates = [p.date for p in payments if hasattr(p, "date") and p.date]
-    if dates:
-        earliest = min(dates)
-        latest = max(dates)
-        fetch_and_store_exchange_rates(db, earliest, latest)
-    else:
+    if not any(getattr(p, "date", None) for p in payments):
         raise ValueError("No valid payment dates found in the imported data.")
 
-    return upsert_payments(db, payments, user_id)
-
 
 def list_payments(
     db: Session,
@@ -190,26 +258,45 @@ def list_payments(
     )
 
 
-def get_payments_csv_stream(db: Session, user_id: int, currency: str | None = None):
-    # Fetch all payments without pagination
-    payments, _ = get_all_payments(db, user_id, currency, page=1, page_size=10**6)
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(
-        [
-            "id",
-            "date",
-            "amount",
-            "currency",
-            "merchant",
-            "auto_category",
-            "source",
-            "type",
-            "note",
-            "cust_category",
-        ]
-    )
-    for p in payments:
+def stream_payments(
+    db: Session, user_id: int, currency: str | None = None
+) -> Iterator[Payment]:
+    return iter_payments(db, user_id, currency)
+
+
+_CSV_HEADER = [
+    "id",
+    "date",
+    "amount",
+    "currency",
+    "merchant",
+    "auto_category",
+    "source",
+    "type",
+    "note",
+    "cust_category",
+]
+
+
+def get_payments_csv_stream(
+    db: Session, user_id: int, currency: str | None = None
+) -> Iterator[str]:
+    """
+    Yield the CSV export line by line, reading payments from a server-side
+    cursor so nothing is buffered beyond the current row.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(_CSV_HEADER)
+    yield flush()
+    for p in iter_payments(db, user_id, currency):
         writer.writerow(
             [
                 p.id,
@@ -224,12 +311,7 @@ def get_payments_csv_stream(db: Session, user_id: int, currency: str | None = No
                 p.category or "",
             ]
         )
-    output.seek(0)
-    return StreamingResponse(
-        output,
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=payments.csv"},
-    )
+        yield flush()
 
 
 def submit_custom_payment(
@@ -346,11 +428,45 @@ def submit_custom_payment(
     )
 
     # Use add_payment for efficient DB insert and duplicate check
-    return add_payment(db, payment, user_id)
+    added = add_payment(db, payment, user_id)
+    _invalidate_aggregates(user_id)
+    return added
 
 
 def delete_payments_by_ids(ids: list, db: Session, user_id: int) -> int:
-    return repo_delete_payments_by_ids(db, ids, user_id)
+    deleted = repo_delete_payments_by_ids(db, ids, user_id)
+    _invalidate_aggregates(user_id)
+    return deleted
+
+
+def _spool_to_disk(src, suffix: str) -> str:
+    """
+    Copy an upload to a named temp file in fixed-size chunks.
+    Returns the path; the caller is responsible for removing it.
+    """
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        with tmp:
+            shutil.copyfileobj(src, tmp, _SPOOL_CHUNK_SIZE)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+    return tmp.name
+
+
+def _spool_and_parse(load_parser, src, suffix: str) -> List[Payment]:
+    """
+    Spool an upload to disk and run its parser on it.
+    Meant to run in a worker thread, one per uploaded file.
+    """
+    tmp_path = _spool_to_disk(src, suffix)
+    try:
+        return load_parser()(tmp_path)
+    finally:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
 
 
 async def import_payment_files_service(
@@ -386,34 +502,55 @@ async def import_payment_files_service(
         ).parse_other_file,
     }
 
-    imported = 0
-    errors = []
-    for file, type in zip(files, types):
-        if type not in parser_funcs:
-            errors.append(
-                f"{getattr(file, 'filename', str(file))}: Unsupported payment type."
+    # Spool and parse every supported upload concurrently, off the event loop
+    supported = [i for i, type in enumerate(types) if type in parser_funcs]
+    parsed = await asyncio.gather(
+        *(
+            asyncio.to_thread(
+                _spool_and_parse,
+                parser_funcs[types[i]],
+                files[i].file,
+                os.path.splitext(getattr(files[i], "filename", "upload"))[1],
             )
-            try:
-                file.file.close()
-            except Exception:
-                pass
+            for i in supported
+        ),
+        return_exceptions=True,
+    )
+    results = dict(zip(supported, parsed))
+
+    errors = []
+    batches: List[List[Payment]] = []
+    for i, file in enumerate(files):
+        filename = getattr(file, "filename", str(file))
+        try:
+            file.file.close()
+        except Exception:
+            pass
+        if i not in results:
+            errors.append(f"{filename}: Unsupported payment type.")
             continue
+        result = results[i]
         try:
-            filename = getattr(file, "filename", "upload")
-            _, ext = os.path.splitext(filename)
-            with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-                shutil.copyfileobj(file.file, tmp)
-                tmp_path = tmp.name
-            parser_func = parser_funcs[type]()
-            imported += _import_payments_with_parser(parser_func, tmp_path, db, user_id)
+            if isinstance(result, BaseException):
+                raise result
+            _prepare_imported_payments(result, db, user_id)
+            batches.append(result)
         except Exception as e:
-            errors.append(f"{getattr(file, 'filename', str(file))}: {str(e)}")
-        finally:
-            try:
-                file.file.close()
-            except Exception:
-                pass
+            errors.append(f"{filename}: {str(e)}")
+
+    if not batches:
+        return {"imported": 0, "errors": errors}
 
+    # Fetch rates and insert all files' payments in a single transaction
+    dates = [p.date for batch in batches for p in batch if p.date]
+    try:
+        fetch_and_store_exchange_rates(db, min(dates), max(dates))
+        imported = sum(upsert_payment_batches(db, batches, user_id))
+    except Exception as e:
+        db.rollback()
+        errors.append(f"Import failed: {str(e)}")
+        return {"imported": 0, "errors": errors}
+    _invalidate_aggregates(user_id)
     return {"imported": imported, "errors": errors}
 
 
@@ -425,7 +562,18 @@ def get_sums_for_ranges_service(
     days: int | None = None,
     months: int | None = None,
 ) -> Dict[str, dict]:
+    # Oldest and newest payment dates, only needed by open-ended ranges
+    oldest_payment: datetime | None = None
+    newest_payment: datetime | None = None
+    if any(not r.get("start") and not r.get("end") for r in ranges.values()):
+        oldest_payment, newest_payment = (
+            db.query(func.min(PaymentORM.date), func.max(PaymentORM.date))
+            .filter(PaymentORM.user_id == user_id)
+            .one()
+        )
+
     result = {}
+    bounds = {}
     for name, range_dict in ranges.items():
         start = range_dict.get("start")
         end = range_dict.get("end")
@@ -436,19 +584,12 @@ def get_sums_for_ranges_service(
 
         # Calculate date span based on newest payment
         if range_months is not None and not start and not end:
-            newest_payment = (
-                db.query(func.max(PaymentORM.date))
-                .filter(PaymentORM.user_id == user_id)
-                .scalar()
-            )
             if newest_payment:
                 year = newest_payment.year
                 month = newest_payment.month - range_months
                 while month <= 0:
                     year -= 1
                     month += 12
-                from calendar import monthrange
-
                 first_day = datetime(year, month, 1)
                 if range_months == 0:
                     # For current month, end_date is the newest payment's date
@@ -457,17 +598,18 @@ def get_sums_for_ranges_service(
                 else:
                     # For past months, end_date is the last day of that month
                     last_day = datetime(
-                        year, month, monthrange(year, month)[1], 23, 59, 59, 999999
+                        year,
+                        month,
+                        calendar.monthrange(year, month)[1],
+                        23,
+                        59,
+                        59,
+                        999999,
                     )
                     start_date = first_day
                     end_date = last_day
         # If days is set and start/end not provided, calculate date span
         elif range_days and not start and not end:
-            newest_payment = (
-                db.query(func.max(PaymentORM.date))
-                .filter(PaymentORM.user_id == user_id)
-                .scalar()
-            )
             if newest_payment:
                 end_date = newest_payment
                 start_date = end_date - timedelta(days=range_days - 1)
@@ -480,29 +622,22 @@ def get_sums_for_ranges_service(
             and not range_months
             and name == "total"
         ):
-            oldest_payment = (
-                db.query(func.min(PaymentORM.date))
-                .filter(PaymentORM.user_id == user_id)
-                .scalar()
-            )
-            newest_payment = (
-                db.query(func.max(PaymentORM.date))
-                .filter(PaymentORM.user_id == user_id)
-                .scalar()
-            )
             start_date = oldest_payment
             end_date = newest_payment
 
-        sum_value = sum_payments_in_db_range(
-            db, user_id, start_date, end_date, currency=currency, days=range_days
-        )
+        bounds[name] = (start_date, end_date, range_days)
         result[name] = {
-            "sum": sum_value,
+            "sum": 0.0,
             "start_date": start_date,
             "end_date": end_date,
             "days": range_days,
             "months": range_months,
         }
+
+    # All ranges are summed in a single query
+    sums = sum_payments_in_db_ranges(db, user_id, bounds, currency=currency)
+    for name, sum_value in sums.items():
+        result[name]["sum"] = sum_value
     return result
 
 
@@ -521,42 +656,59 @@ def aggregate_payments_sankey_db(
 ):
     """
     Efficiently aggregate payments by category using the database layer.
+    Results are cached briefly per user and range, see _SANKEY_CACHE.
     """
+    key = (user_id, start_date, end_date, currency, days)
+    with _SANKEY_CACHE_LOCK:
+        cached = _SANKEY_CACHE.get(key)
+    if cached is not None:
+        return cached
     result, metadata = sum_payments_by_category_db(
         db, user_id, category_tree, start_date, end_date, currency, days
     )
     sankey_data = build_sankey_data(result, metadata, category_tree)
+    with _SANKEY_CACHE_LOCK:
+        _SANKEY_CACHE[key] = sankey_data
     return sankey_data
 
 
 def add_payments_list(
-    payments_data: List[dict], db: Session, user_id: int
+    payments_data: Iterable, db: Session, user_id: int
 ) -> List[Payment]:
     """
     Add a list of payments to the database.
+    Items are read by attribute (date, amount, currency, merchant, type and
+    optionally source, note, category), so request models can be passed as is.
     Returns the list of added Payment domain objects.
     """
     added_payments = []
-    for data in payments_data:
-        # Assert currency is valid
-        if data["currency"] not in SUPPORTED_CURRENCIES:
-            raise ValueError(f"Unsupported currency: {data['currency']}")
-        payment_type_enum = PaymentType(data["type"])
-        payment_source = PaymentSource(data.get("source", PaymentSource.OTHER.value))
-        payment = Payment(
-            date=data["date"],
-            amount=data["amount"],
-            currency=data["currency"],
-            merchant=data["merchant"],
-            auto_category=data.get("auto_category", ""),
-            category=data.get("category", ""),
-            source=payment_source,
-            type=payment_type_enum,
-            note=data.get("note", ""),
-            user_id=user_id,
-        )
-        added = add_payment(db, payment, user_id)
-        added_payments.append(added)
+    # add_payment commits each row, so drop cached aggregates even when a
+    # later item fails and the earlier rows are already stored
+    try:
+        for data in payments_data:
+            # Assert currency is valid
+            if data.currency not in SUPPORTED_CURRENCIES:
+                raise ValueError(f"Unsupported currency: {data.currency}")
+            payment_type_enum = PaymentType(data.type)
+            payment_source = PaymentSource(
+                getattr(data, "source", None) or PaymentSource.OTHER.value
+            )
+            payment = Payment(
+                date=data.date,
+                amount=data.amount,
+                currency=data.currency,
+                merchant=data.merchant,
+                auto_category=getattr(data, "auto_category", None) or "",
+                category=getattr(data, "category", None) or "",
+                source=payment_source,
+                type=payment_type_enum,
+                note=getattr(data, "note", None) or "",
+                user_id=user_id,
+            )
+            added = add_payment(db, payment, user_id)
+            added_payments.append(added)
+    finally:
+        _invalidate_aggregates(user_id)
     return added_payments
 
 
@@ -1,11 +1,13 @@
+import asyncio
 import os
 import re
 import shutil
 import tempfile
+import threading
 import zipfile
 from datetime import datetime as _dt
 from types import SimpleNamespace
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import requests
 from fastapi import UploadFile
@@ -13,9 +15,50 @@ from sqlalchemy.orm import Session
 
 from app.domain.services.payment_service import import_payment_files_service
 
-# In-memory cache:
-# key = username (derived from recipient or sender), value = list of metadata dicts
-MAILGUN_ATTACHMENT_CACHE: Dict[str, List[Dict[str, Any]]] = {}
+# In-memory cache, sharded by username so concurrent requests for different
+# users don't contend on a single lock. Each shard maps
+# username (derived from recipient or sender) -> list of metadata dicts.
+_CACHE_SHARD_COUNT = 16
+_CACHE_SHARDS: List[Tuple[threading.Lock, Dict[str, List[Dict[str, Any]]]]] = [
+    (threading.Lock(), {}) for _ in range(_CACHE_SHARD_COUNT)
+]
+
+# Limits checked against the zip directory before anything is extracted
+_MAX_UNCOMPRESSED_BYTES = int(
+    os.getenv("MAILGUN_ZIP_MAX_UNCOMPRESSED_BYTES", str(2 * 1024**3))
+)
+_MAX_ENTRIES = int(os.getenv("MAILGUN_ZIP_MAX_ENTRIES", "50000"))
+_MAX_COMPRESSION_RATIO = int(os.getenv("MAILGUN_ZIP_MAX_COMPRESSION_RATIO", "200"))
+
+# Cached zips extracted in parallel by one import request
+_EXTRACT_CONCURRENCY = 4
+
+
+def _cache_shard(username: str) -> Tuple[threading.Lock, Dict[str, List[Dict]]]:
+    return _CACHE_SHARDS[hash(username) % _CACHE_SHARD_COUNT]
+
+
+def _get_cached_entries(username: str) -> List[Dict[str, Any]]:
+    """Return a snapshot of the cached entries for username."""
+    lock, shard = _cache_shard(username)
+    with lock:
+        return list(shard.get(username, []))
+
+
+def _add_cached_entries(username: str, entries: List[Dict[str, Any]]) -> None:
+    lock, shard = _cache_shard(username)
+    with lock:
+        shard.setdefault(username, []).extend(entries)
+
+
+def _remove_cached_entries(username: str, entries: List[Dict[str, Any]]) -> None:
+    lock, shard = _cache_shard(username)
+    with lock:
+        remaining = [e for e in shard.get(username, []) if e not in entries]
+        if remaining:
+            shard[username] = remaining
+        else:
+            shard.pop(username, None)
 
 
 def _derive_username_from_recipient(recipient: Any) -> str:
@@ -28,6 +71,9 @@ def _derive_username_from_recipient(recipient: Any) -> str:
 
 
 def _derive_cache_username_from_user(current_user: Any) -> str:
+    cached = getattr(current_user, "_mailgun_cache_username", None)
+    if cached is not None:
+        return cached
     candidate = getattr(current_user, "email", None) or getattr(
         current_user, "username", None
     )
@@ -35,10 +81,18 @@ def _derive_cache_username_from_user(current_user: Any) -> str:
         s = str(candidate)
         if "@" in s:
             local = s.split(",")[0].strip().split("@")[0]
-            return local.split("+")[0]
-        return s
-    uid = getattr(current_user, "id", None)
-    return f"user_{uid}" if uid is not None else "unknown_user"
+            username = local.split("+")[0]
+        else:
+            username = s
+    else:
+        uid = getattr(current_user, "id", None)
+        username = f"user_{uid}" if uid is not None else "unknown_user"
+    # Memoize on the user object; ignore objects that reject new attributes
+    try:
+        object.__setattr__(current_user, "_mailgun_cache_username", username)
+    except (AttributeError, TypeError):
+        pass
+    return username
 
 
 def extract_wechat_download_url(html: str) -> Optional[str]:
@@ -92,7 +146,7 @@ def download_zip_to_tempfile(url: str, filename: str) -> str:
 def cache_mailgun_form_attachments(form) -> Tuple[str, List[Dict[str, Any]]]:
     """
     Process a Mailgun inbound multipart form, persist file attachments to temp files,
-    and cache metadata in MAILGUN_ATTACHMENT_CACHE.
+    and cache metadata in the in-memory attachment cache.
 
     Returns (username, saved_metadata_list).
 
@@ -104,6 +158,7 @@ def cache_mailgun_form_attachments(form) -> Tuple[str, List[Dict[str, Any]]]:
     username = _derive_username_from_recipient(recipient)
 
     saved = []
+    now = _dt.utcnow()
     for key, value in form.multi_items():
         if hasattr(value, "filename") and value.filename:
             upload: UploadFile = value  # type: ignore
@@ -124,7 +179,7 @@ def cache_mailgun_form_attachments(form) -> Tuple[str, List[Dict[str, Any]]]:
                     "filename": filename,
                     "path": tmp_path,
                     "content_type": getattr(upload, "content_type", None),
-                    "received_at": _dt.utcnow(),
+                    "received_at": now,
                     "mailgun_field": key,
                 }
                 saved.append(meta)
@@ -143,7 +198,7 @@ def cache_mailgun_form_attachments(form) -> Tuple[str, List[Dict[str, Any]]]:
                 "filename": filename,
                 "path": tmp_path,
                 "content_type": "application/zip",
-                "received_at": _dt.utcnow(),
+                "received_at": now,
                 "mailgun_field": "download_link",
             }
             saved.append(meta)
@@ -151,7 +206,7 @@ def cache_mailgun_form_attachments(form) -> Tuple[str, List[Dict[str, Any]]]:
     if not saved:
         raise ValueError("No attachments or downloadable files found in Mailgun POST")
 
-    MAILGUN_ATTACHMENT_CACHE.setdefault(username, []).extend(saved)
+    _add_cached_entries(username, saved)
     return username, saved
 
 
@@ -161,7 +216,7 @@ def get_mailgun_cached_files_for_user(current_user: Any) -> Dict[str, Any]:
     Does not expose filesystem paths.
     """
     username = _derive_cache_username_from_user(current_user)
-    entries = MAILGUN_ATTACHMENT_CACHE.get(username, [])
+    entries = _get_cached_entries(username)
     files = []
     for m in entries:
         received = m.get("received_at")
@@ -180,6 +235,152 @@ def get_mailgun_cached_files_for_user(current_user: Any) -> Dict[str, Any]:
     return {"username": username, "cached_files": len(entries), "files": files}
 
 
+def _iter_files(root: str) -> Iterator[os.DirEntry]:
+    """
+    Yield regular files below root using os.scandir, which reuses the
+    directory entry type and avoids a stat() per file compared to os.walk.
+    """
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+def _check_zip_limits(infos: List[zipfile.ZipInfo]) -> Optional[str]:
+    """
+    Reject archives that would extract to too many files or too many bytes.
+    Returns an error message, or None if the archive is within limits.
+    """
+    if len(infos) > _MAX_ENTRIES:
+        return f"zip has too many entries ({len(infos)} > {_MAX_ENTRIES})"
+    total_uncompressed = sum(i.file_size for i in infos)
+    if total_uncompressed > _MAX_UNCOMPRESSED_BYTES:
+        return (
+            f"zip uncompressed size {total_uncompressed} bytes exceeds "
+            f"limit of {_MAX_UNCOMPRESSED_BYTES} bytes"
+        )
+    # Only apply the ratio heuristic to archives of meaningful size, tiny
+    # repetitive CSVs can legitimately compress very well
+    total_compressed = sum(i.compress_size for i in infos)
+    if (
+        total_uncompressed > 1024**2
+        and total_uncompressed > _MAX_COMPRESSION_RATIO * max(total_compressed, 1)
+    ):
+        return "zip compression ratio is suspiciously high"
+    return None
+
+
+def _extract_cached_zip(
+    fname: str, zip_path: str, pwd: str
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Extract one cached zip into a fresh temp dir.
+    Returns (tmpdir, None) on success or (None, error) with the dir removed.
+    """
+    tmpdir = tempfile.mkdtemp()
+
+    def fail(message: str) -> Tuple[Optional[str], Optional[str]]:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        return None, f"{fname}: {message}"
+
+    try:
+        with zipfile.ZipFile(zip_path, "r") as zf:
+            infos = zf.infolist()
+            limit_error = _check_zip_limits(infos)
+            if limit_error:
+                return fail(limit_error)
+
+            # Determine which compression methods this runtime supports
+            supported_types = {getattr(zipfile, "ZIP_STORED", 0)}
+            try:
+                import zlib  # type: ignore
+
+                if zlib:
+                    pass
+            except Exception:
+                pass
+            else:
+                supported_types.add(getattr(zipfile, "ZIP_DEFLATED", 8))
+            try:
+                import bz2  # type: ignore
+
+                if bz2:
+                    pass
+            except Exception:
+                pass
+            else:
+                supported_types.add(getattr(zipfile, "ZIP_BZIP2", 12))
+            try:
+                import lzma  # type: ignore
+
+                if lzma:
+                    pass
+            except Exception:
+                pass
+            else:
+                supported_types.add(getattr(zipfile, "ZIP_LZMA", 14))
+
+            # Inspect archive entries for unsupported compression methods
+            unsupported = set()
+            for info in infos:
+                if info.compress_type not in supported_types:
+                    unsupported.add(info.compress_type)
+
+            # try pyzipper for AES-encrypted zips (method 99)
+            pwd_bytes = bytes(pwd, "utf-8") if pwd else None
+            if unsupported:
+                # Commonly 99 indicates AES/encrypted zip entries
+                if unsupported != {99}:
+                    return fail(
+                        "zip contains unsupported "
+                        f"compression methods: {sorted(list(unsupported))}"
+                    )
+                # Try pyzipper if available
+                try:
+                    import pyzipper  # type: ignore
+                except Exception:
+                    return fail("Install 'pyzipper' to extract such archives.")
+                try:
+                    # attempt extraction with pyzipper
+                    with pyzipper.AESZipFile(zip_path, "r") as za:
+                        if pwd_bytes:
+                            za.pwd = pwd_bytes
+                        za.extractall(tmpdir)
+                except RuntimeError as er:
+                    em = str(er).lower()
+                    if "password" in em or "encrypted" in em:
+                        return fail("failed to unzip (bad password)")
+                    return fail(f"pyzipper unzip runtime error: {er}")
+                except Exception as e:
+                    return fail(f"pyzipper extraction failed: {e}")
+            else:
+                # Check for encryption (flag bit 0x1)
+                is_encrypted = any(info.flag_bits & 0x1 for info in infos)
+                if is_encrypted and not pwd_bytes:
+                    return fail("zip is encrypted but no password provided")
+
+                # Try extraction; if a RuntimeError occurs, classify it properly
+                try:
+                    if pwd_bytes:
+                        zf.extractall(tmpdir, pwd=pwd_bytes)
+                    else:
+                        zf.extractall(tmpdir)
+                except RuntimeError as er:
+                    em = str(er).lower()
+                    if "password" in em or "encrypted" in em:
+                        return fail("failed to unzip (bad password)")
+                    return fail(f"unzip runtime error: {er}")
+                except zipfile.BadZipFile:
+                    return fail("not a zip or corrupted")
+    except Exception as e:
+        return fail(f"unzip error: {e}")
+    return tmpdir, None
+
+
 async def import_cached_mailgun_zips(
     items: Iterable[Any], db: Session, current_user: Any
 ) -> Dict[str, Any]:
@@ -193,8 +394,11 @@ async def import_cached_mailgun_zips(
     if not items:
         return {"imported": 0, "errors": ["No items provided"]}
 
-    cache_list = MAILGUN_ATTACHMENT_CACHE.get(username, [])
+    cache_list = _get_cached_entries(username)
 
+    # Resolve every item against the cache first; each slot is either an
+    # error string or the (fname, ptype, cache entry, zip path, password) job
+    slots: List[Any] = []
     for raw_item in items:
         if isinstance(raw_item, dict):
             item = raw_item
@@ -212,7 +416,7 @@ async def import_cached_mailgun_zips(
         pwd = item.get("password") or ""
         ptype = item.get("type")
         if not fname or not ptype:
-            errors.append(f"{fname or '<unknown>'}: missing filename or type")
+            slots.append(f"{fname or '<unknown>'}: missing filename or type")
             continue
 
         match = None
@@ -221,150 +425,51 @@ async def import_cached_mailgun_zips(
                 match = e
                 break
         if not match:
-            errors.append(f"{fname}: not found in cache")
+            slots.append(f"{fname}: not found in cache")
             continue
 
         zip_path = match.get("path")
         if not zip_path or not os.path.exists(zip_path):
-            errors.append(f"{fname}: cached file missing on disk")
+            slots.append(f"{fname}: cached file missing on disk")
             continue
 
-        tmpdir = tempfile.mkdtemp()
-        tmpdirs.append(tmpdir)
-        try:
-            with zipfile.ZipFile(zip_path, "r") as zf:
-                # Determine which compression methods this runtime supports
-                supported_types = {getattr(zipfile, "ZIP_STORED", 0)}
-                try:
-                    import zlib  # type: ignore
+        slots.append((fname, ptype, match, zip_path, pwd))
 
-                    if zlib:
-                        pass
-                except Exception:
-                    pass
-                else:
-                    supported_types.add(getattr(zipfile, "ZIP_DEFLATED", 8))
-                try:
-                    import bz2  # type: ignore
+    # Extract the archives concurrently in worker threads, a few at a time
+    semaphore = asyncio.Semaphore(_EXTRACT_CONCURRENCY)
 
-                    if bz2:
-                        pass
-                except Exception:
-                    pass
-                else:
-                    supported_types.add(getattr(zipfile, "ZIP_BZIP2", 12))
-                try:
-                    import lzma  # type: ignore
+    async def extract(job: Tuple[str, str, Dict[str, Any], str, str]):
+        fname, _, _, zip_path, pwd = job
+        async with semaphore:
+            return await asyncio.to_thread(_extract_cached_zip, fname, zip_path, pwd)
 
-                    if lzma:
-                        pass
-                except Exception:
-                    pass
-                else:
-                    supported_types.add(getattr(zipfile, "ZIP_LZMA", 14))
-
-                # Inspect archive entries for unsupported compression methods
-                unsupported = set()
-                for info in zf.infolist():
-                    if info.compress_type not in supported_types:
-                        unsupported.add(info.compress_type)
-
-                # try pyzipper for AES-encrypted zips (method 99)
-                pwd_bytes = bytes(pwd, "utf-8") if pwd else None
-                if unsupported:
-                    # Commonly 99 indicates AES/encrypted zip entries
-                    if unsupported == {99}:
-                        # Try pyzipper if available
-                        try:
-                            import pyzipper  # type: ignore
-                        except Exception:
-                            errors.append(
-                                f"{fname}: Install 'pyzipper' to extract such archives."
-                            )
-                            shutil.rmtree(tmpdir, ignore_errors=True)
-                            tmpdirs.pop()
-                            continue
-                        try:
-                            # attempt extraction with pyzipper
-                            with pyzipper.AESZipFile(zip_path, "r") as za:
-                                if pwd_bytes:
-                                    za.pwd = pwd_bytes
-                                za.extractall(tmpdir)
-                        except RuntimeError as er:
-                            em = str(er).lower()
-                            if "password" in em or "encrypted" in em:
-                                errors.append(
-                                    f"{fname}: failed to unzip (bad password)"
-                                )
-                            else:
-                                errors.append(
-                                    f"{fname}: pyzipper unzip runtime error: {er}"
-                                )
-                            shutil.rmtree(tmpdir, ignore_errors=True)
-                            tmpdirs.pop()
-                            continue
-                        except Exception as e:
-                            errors.append(f"{fname}: pyzipper extraction failed: {e}")
-                            shutil.rmtree(tmpdir, ignore_errors=True)
-                            tmpdirs.pop()
-                            continue
-                    else:
-                        errors.append(
-                            f"{fname}: zip contains unsupported "
-                            f"compression methods: {sorted(list(unsupported))}"
-                        )
-                        shutil.rmtree(tmpdir, ignore_errors=True)
-                        tmpdirs.pop()
-                        continue
-
-                # If we reach here use zipfile for extraction;
-                # if we already used pyzipper above, files are in tmpdir
-                if not unsupported:
-                    # Check for encryption (flag bit 0x1)
-                    is_encrypted = any(info.flag_bits & 0x1 for info in zf.infolist())
-                    if is_encrypted and not pwd_bytes:
-                        errors.append(
-                            f"{fname}: zip is encrypted but no password provided"
-                        )
-                        shutil.rmtree(tmpdir, ignore_errors=True)
-                        tmpdirs.pop()
-                        continue
-
-                    # Try extraction; if a RuntimeError occurs, classify it properly
-                    try:
-                        if pwd_bytes:
-                            zf.extractall(tmpdir, pwd=pwd_bytes)
-                        else:
-                            zf.extractall(tmpdir)
-                    except RuntimeError as er:
-                        em = str(er).lower()
-                        if "password" in em or "encrypted" in em:
-                            errors.append(f"{fname}: failed to unzip (bad password)")
-                        else:
-                            errors.append(f"{fname}: unzip runtime error: {er}")
-                        shutil.rmtree(tmpdir, ignore_errors=True)
-                        tmpdirs.pop()
-                        continue
-                    except zipfile.BadZipFile:
-                        errors.append(f"{fname}: not a zip or corrupted")
-                        shutil.rmtree(tmpdir, ignore_errors=True)
-                        tmpdirs.pop()
-                        continue
+    jobs = [slot for slot in slots if isinstance(slot, tuple)]
+    extracted = iter(await asyncio.gather(*(extract(job) for job in jobs)))
 
+    # Collect results in the original item order
+    for slot in slots:
+        if isinstance(slot, str):
+            errors.append(slot)
+            continue
+        fname, ptype, match, _, _ = slot
+        tmpdir, extract_error = next(extracted)
+        if extract_error:
+            errors.append(extract_error)
+            continue
+        tmpdirs.append(tmpdir)
+        try:
             any_extracted = False
-            for root, _, filenames in os.walk(tmpdir):
-                for file in filenames:
-                    any_extracted = True
-                    fp = os.path.join(root, file)
-                    try:
-                        fobj = open(fp, "rb")
-                    except Exception as e:
-                        errors.append(
-                            f"{fname}: failed to open extracted file {file}: {e}"
-                        )
-                        continue
-                    wrappers.append(SimpleNamespace(file=fobj, filename=file))
-                    types_list.append(ptype)
+            for entry in _iter_files(tmpdir):
+                any_extracted = True
+                try:
+                    fobj = open(entry.path, "rb")
+                except Exception as e:
+                    errors.append(
+                        f"{fname}: failed to open extracted file {entry.name}: {e}"
+                    )
+                    continue
+                wrappers.append(SimpleNamespace(file=fobj, filename=entry.name))
+                types_list.append(ptype)
 
             if not any_extracted:
                 errors.append(f"{fname}: zip opened but no files extracted")
@@ -374,8 +479,7 @@ async def import_cached_mailgun_zips(
         except Exception as e:
             errors.append(f"{fname}: unzip error: {e}")
             shutil.rmtree(tmpdir, ignore_errors=True)
-            if tmpdir in tmpdirs:
-                tmpdirs.remove(tmpdir)
+            tmpdirs.remove(tmpdir)
             continue
 
     if not wrappers:
@@ -408,48 +512,36 @@ async def import_cached_mailgun_zips(
     errors.extend(import_errors)
 
     if imported > 0 and processed_cache_entries:
-        remaining = MAILGUN_ATTACHMENT_CACHE.get(username, [])
-        for entry in processed_cache_entries:
-            try:
-                if entry in remaining:
-                    remaining.remove(entry)
-                path = entry.get("path")
-                if path and os.path.exists(path):
-                    try:
-                        os.remove(path)
-                    except Exception:
-                        pass
-            except Exception:
-                pass
-        if remaining:
-            MAILGUN_ATTACHMENT_CACHE[username] = remaining
-        else:
-            MAILGUN_ATTACHMENT_CACHE.pop(username, None)
+        _remove_cached_entries(username, processed_cache_entries)
+        for cached in processed_cache_entries:
+            path = cached.get("path")
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except Exception:
+                    pass
 
     return {"imported": imported, "errors": errors}
 
 
 def remove_mailgun_cached_file_for_user(current_user: Any, filename: str) -> None:
     username = _derive_cache_username_from_user(current_user)
-    entries = MAILGUN_ATTACHMENT_CACHE.get(username, [])
-    match = None
-    for e in entries:
-        if e.get("filename") == filename:
-            match = e
-            break
-    if not match:
-        raise ValueError(f"{filename}: not found in cache for user {username}")
+    lock, shard = _cache_shard(username)
+    with lock:
+        entries = shard.get(username, [])
+        match = None
+        for e in entries:
+            if e.get("filename") == filename:
+                match = e
+                break
+        if not match:
+            raise ValueError(f"{filename}: not found in cache for user {username}")
+        entries.remove(match)
+        if not entries:
+            shard.pop(username, None)
     path = match.get("path")
     if path and os.path.exists(path):
         try:
             os.remove(path)
         except Exception:
             pass
-    try:
-        entries.remove(match)
-    except Exception:
-        pass
-    if entries:
-        MAILGUN_ATTACHMENT_CACHE[username] = entries
-    else:
-        MAILGUN_ATTACHMENT_CACHE.pop(username, None)
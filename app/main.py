@@ -1,16 +1,52 @@
+import logging
 import os
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
+from app.data.base import create_tables
+from app.domain.services.auth_service import benchmark_password_hash
 from app.presentation.mailgun_api import router as mailgun_router
 from app.presentation.payments_api import router as payments_router
+from app.presentation.responses import ORJSONResponse
+from app.presentation.user_api import close_hcaptcha_client
 from app.presentation.user_api import router as auth_router
 
 load_dotenv()  # Load environment variables from .env
 
-app = FastAPI(title="Payment API", version="1.0.0")
+# Uvicorn only configures its own loggers; give the app's module loggers a
+# handler of their own. The root logger is left alone so libraries such as
+# SQLAlchemy don't start logging at INFO.
+_app_logger = logging.getLogger("app")
+if not _app_logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(
+        logging.Formatter("%(levelname)s:  %(name)s: %(message)s")
+    )
+    _app_logger.addHandler(_log_handler)
+    _app_logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create missing tables once per process, after every router (and so
+    # every ORM model) has been imported, rather than as an import side effect
+    await run_in_threadpool(create_tables)
+    await run_in_threadpool(benchmark_password_hash)
+    yield
+    await close_hcaptcha_client()
+
+
+app = FastAPI(
+    title="Payment API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
 
 cors_origins = os.getenv("CORS_ORIGINS", "")
 origins = [origin.strip() for origin in cors_origins.split(",") if origin.strip()]
@@ -19,9 +55,14 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Explicit lists match by set membership; max_age lets browsers reuse
+    # preflight results for a day instead of re-asking on every call
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
+    allow_headers=["Authorization", "Content-Type", "If-None-Match"],
+    max_age=86400,
 )
+# Added last so it wraps CORS and compresses the final response
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 app.include_router(auth_router)
 app.include_router(payments_router)
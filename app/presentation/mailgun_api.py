@@ -1,31 +1,22 @@
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from app.data.repositories.payment_repository import SessionLocal
+from app.data.base import get_db
 from app.domain.services.auth_service import get_current_user
-from app.integrations.mail_service import (
-    remove_mailgun_cached_file_for_user,  # <-- new import
-)
 from app.integrations.mail_service import (
     cache_mailgun_form_attachments,
     get_mailgun_cached_files_for_user,
     import_cached_mailgun_zips,
+    remove_mailgun_cached_file_for_user,
 )
 
 router = APIRouter(prefix="/api/mailgun", tags=["mailgun"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.post("/inbound")
 async def mailgun_inbound_endpoint(request: Request):
     """
@@ -76,8 +67,6 @@ async def import_cached_mailgun_files(
     items_as_dicts = [i.model_dump() for i in req.items]
     result = await import_cached_mailgun_zips(items_as_dicts, db, current_user)
     if result.get("imported", 0) == 0 and result.get("errors"):
-        from fastapi.responses import JSONResponse
-
         return JSONResponse(status_code=400, content={"detail": result["errors"]})
     return result
 
@@ -1,7 +1,7 @@
 from datetime import datetime
-from enum import Enum
 from typing import Any, Dict, List, Optional
 
+import orjson
 from fastapi import (
     APIRouter,
     Body,
@@ -10,27 +10,38 @@ from fastapi import (
     Form,
     HTTPException,
     Query,
+    Request,
+    Response,
     UploadFile,
 )
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field, RootModel
 from sqlalchemy.orm import Session
 
-from app.data.repositories.payment_repository import SessionLocal
-from app.domain.models.payment import Payment
+from app.data.base import SessionLocal, get_db
+from app.domain.models.payment import Payment, PaymentSource, PaymentType
 from app.domain.services.auth_service import get_current_user
 from app.domain.services.payment_service import (
+    add_payments_list,
     aggregate_payments_sankey_db,
     all_merchant_same_category_service,
+    delete_payments_by_ids,
+    fetch_and_store_exchange_rates,
     get_category_tree,
+    get_category_tree_json,
     get_payments_csv_stream,
     get_sums_for_ranges_service,
     import_payment_files_service,
     list_categories,
     list_payments,
+    stream_payments,
+    submit_custom_payment,
     update_category_tree,
     update_merchant_categories,
     update_payment_category,
 )
+from app.presentation.responses import ORJSONResponse, etag_response
 
 
 # --- Category models ---
@@ -49,17 +60,36 @@ class UpdateCategoryRequest(BaseModel):
     all_for_merchant: bool = False
 
 
-class AggregateRequest(BaseModel):
-    start_date: Optional[datetime] = None
-    end_date: Optional[datetime] = None
-
-
 class SumsRequest(RootModel):
     root: Dict[str, Dict[str, Optional[Any]]] = Field(
         ..., description="Mapping from name to {start, end, days}"
     )
 
 
+# Enum member -> wire string, looked up once per row instead of
+# isinstance checks and .value attribute access
+_SOURCE_STR = {m: m.value for m in PaymentSource}
+_TYPE_STR = {m: m.value for m in PaymentType}
+
+
+def payment_to_dict(p: Payment) -> Dict[str, Any]:
+    """
+    Plain-dict form of PaymentResponse, rendered directly by ORJSONResponse.
+    """
+    return {
+        "id": p.id,
+        "date": p.date,
+        "amount": p.amount,
+        "currency": p.currency,
+        "merchant": p.merchant,
+        "auto_category": p.auto_category,
+        "source": _SOURCE_STR.get(p.source) or str(p.source),
+        "type": _TYPE_STR[p.type],
+        "note": p.note or "",
+        "cust_category": p.category or "",
+    }
+
+
 class PaymentResponse(BaseModel):
     id: int
     date: datetime
@@ -72,20 +102,10 @@ class PaymentResponse(BaseModel):
     note: str = ""
     cust_category: str = ""
 
-    @staticmethod
-    def from_domain(p: Payment) -> "PaymentResponse":
-        return PaymentResponse(
-            id=p.id,
-            date=p.date,
-            amount=p.amount,
-            currency=p.currency,
-            merchant=p.merchant,
-            auto_category=p.auto_category,
-            source=p.source.value if isinstance(p.source, Enum) else str(p.source),
-            type=p.type.value,
-            note=p.note or "",
-            cust_category=p.category,
-        )
+    @classmethod
+    def from_domain(cls, p: Payment) -> "PaymentResponse":
+        # Fields come from a stored Payment, so skip validation
+        return cls.model_construct(**payment_to_dict(p))
 
 
 class PaginatedPaymentsResponse(BaseModel):
@@ -95,19 +115,16 @@ class PaginatedPaymentsResponse(BaseModel):
     page_size: int
 
 
-router = APIRouter(prefix="/api/payments", tags=["payments"])
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+router = APIRouter(
+    prefix="/api/payments",
+    tags=["payments"],
+    default_response_class=ORJSONResponse,
+)
 
 
-@router.get("", response_model=PaginatedPaymentsResponse)
+@router.get("", responses={200: {"model": PaginatedPaymentsResponse}})
 def get_all_payments_endpoint(
+    request: Request,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
     currency: Optional[str] = None,
@@ -116,37 +133,75 @@ def get_all_payments_endpoint(
     search: Optional[str] = Query(None, description="Search term"),
     sort_field: str = Query("date", description="Field to sort by"),
     sort_direction: str = Query("desc", description="Sort direction: 'asc' or 'desc'"),
-) -> PaginatedPaymentsResponse:
-    payments, total = list_payments(
-        db,
-        current_user.id,
-        currency,
-        page,
-        page_size,
-        search,
-        sort_field,
-        sort_direction,
-    )
-    return PaginatedPaymentsResponse(
-        payments=[PaymentResponse.from_domain(p) for p in payments],
-        total=total,
-        page=page,
-        page_size=page_size,
+):
+    try:
+        payments, total = list_payments(
+            db,
+            current_user.id,
+            currency,
+            page,
+            page_size,
+            search,
+            sort_field,
+            sort_direction,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Build plain dicts and return the response directly, skipping
+    # response_model validation and jsonable_encoder on the hot list path
+    rows = [payment_to_dict(p) for p in payments]
+    return etag_response(
+        request,
+        {"payments": rows, "total": total, "page": page, "page_size": page_size},
     )
 
 
-@router.get("/categories", response_model=List[str])
+def _stream_with_own_session(produce, *args):
+    """
+    Yield from produce(db, *args) on a session opened and closed here.
+    A streamed body is consumed after the endpoint returns, when the request's
+    get_db session is already closed, so it can't read from that one.
+    """
+    db = SessionLocal()
+    try:
+        yield from produce(db, *args)
+    finally:
+        db.close()
+
+
+@router.get("/stream")
+def stream_all_payments_endpoint(
+    current_user=Depends(get_current_user),
+    currency: Optional[str] = None,
+):
+    """
+    Stream all payments as newline-delimited JSON, one payment per line.
+    Rows are read from a server-side cursor, so memory stays flat.
+    """
+
+    def generate():
+        for p in _stream_with_own_session(stream_payments, current_user.id, currency):
+            yield orjson.dumps(payment_to_dict(p)) + b"\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.get("/categories", responses={200: {"model": List[str]}})
 def get_categories(
     db: Session = Depends(get_db), current_user=Depends(get_current_user)
 ):
-    return list_categories(db, current_user.id)
+    return ORJSONResponse(list_categories(db, current_user.id))
 
 
-@router.get("/categories/tree", response_model=Dict[str, Any])
+@router.get("/categories/tree", responses={200: {"model": Dict[str, Any]}})
 def get_categories_tree(
     db: Session = Depends(get_db), current_user=Depends(get_current_user)
 ):
-    return get_category_tree(db, current_user.id)
+    # Served from the pre-encoded per-user cache, no encoding on the read path
+    return Response(
+        content=get_category_tree_json(db, current_user.id),
+        media_type="application/json",
+    )
 
 
 @router.put("/categories/tree")
@@ -202,7 +257,7 @@ def aggregate_payments_sankey_endpoint(
         currency=currency,
         days=req.days,
     )
-    return result
+    return ORJSONResponse(result)
 
 
 @router.post("/sums")
@@ -219,9 +274,12 @@ def get_sums_for_ranges(
         description="Sum payments for the Xth previous month (0=current, 1=past, ...)",
     ),
 ):
-    return get_sums_for_ranges_service(
+    # Sync endpoint, so the queries and the orjson render both run in the
+    # threadpool; returning the response skips the event-loop serialization
+    result = get_sums_for_ranges_service(
         req.root, db, current_user.id, currency, days=days, months=months
     )
+    return ORJSONResponse(result)
 
 
 @router.post("/import")
@@ -233,8 +291,6 @@ async def import_payments_endpoint(
 ):
     result = await import_payment_files_service(files, types, db, current_user.id)
     if result.get("errors"):
-        from fastapi.responses import JSONResponse
-
         return JSONResponse(
             status_code=400,
             content={
@@ -247,11 +303,14 @@ async def import_payments_endpoint(
 
 @router.get("/download")
 def download_all_payments(
-    db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
     currency: Optional[str] = None,
 ):
-    return get_payments_csv_stream(db, current_user.id, currency)
+    return StreamingResponse(
+        _stream_with_own_session(get_payments_csv_stream, current_user.id, currency),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=payments.csv"},
+    )
 
 
 class SubmitPaymentRequest(BaseModel):
@@ -271,8 +330,6 @@ def submit_payment(
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
-    from app.domain.services.payment_service import submit_custom_payment
-
     try:
         payment = submit_custom_payment(
             date=req.date,
@@ -291,6 +348,65 @@ def submit_payment(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+_FAST_REQUIRED_STR_FIELDS = ("date", "currency", "merchant", "type")
+_FAST_OPTIONAL_STR_FIELDS = ("source", "note", "category")
+
+
+def _check_fast_payment_fields(data: Any) -> None:
+    """
+    Cheap type checks standing in for the pydantic model, so malformed
+    bodies are answered with 400 instead of failing in the database.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Body must be a JSON object")
+    for field in _FAST_REQUIRED_STR_FIELDS:
+        if not isinstance(data[field], str):
+            raise ValueError(f"{field} must be a string")
+    amount = data["amount"]
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+        raise ValueError("amount must be a number")
+    for field in _FAST_OPTIONAL_STR_FIELDS:
+        if data.get(field) is not None and not isinstance(data[field], str):
+            raise ValueError(f"{field} must be a string")
+
+
+@router.post("/fast", responses={200: {"model": PaymentResponse}})
+async def submit_payment_fast(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """
+    Same as POST /api/payments, for trusted internal clients: the body is
+    decoded with orjson and only type-checked, without pydantic validation.
+    The service still checks currency, type, source and category.
+    """
+    try:
+        data = orjson.loads(await request.body())
+        _check_fast_payment_fields(data)
+        raw_date = data["date"]
+        if raw_date.endswith("Z"):
+            raw_date = raw_date[:-1] + "+00:00"
+        payment = await run_in_threadpool(
+            submit_custom_payment,
+            date=datetime.fromisoformat(raw_date),
+            amount=float(data["amount"]),
+            currency=data["currency"],
+            merchant=data["merchant"],
+            payment_type=data["type"],
+            db=db,
+            user_id=current_user.id,
+            source=data.get("source"),
+            note=data.get("note") or "",
+            category=data.get("category") or "",
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Missing field: {e.args[0]}")
+    except (TypeError, AttributeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ORJSONResponse(payment_to_dict(payment))
+
+
 class DeletePaymentsRequest(BaseModel):
     ids: List[int]
 
@@ -301,8 +417,6 @@ def delete_payments(
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
-    from app.domain.services.payment_service import delete_payments_by_ids
-
     try:
         deleted = delete_payments_by_ids(req.ids, db, current_user.id)
         return {"deleted": deleted}
@@ -314,23 +428,18 @@ class BatchPaymentRequest(BaseModel):
     payments: List[SubmitPaymentRequest]
 
 
-@router.post("/batch", response_model=List[PaymentResponse])
+@router.post("/batch", responses={200: {"model": List[PaymentResponse]}})
 def submit_payments_batch(
     req: BatchPaymentRequest,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
-    from app.domain.services.payment_service import add_payments_list
-
-    payments_data = [p.model_dump() for p in req.payments]
-    # Convert datetime fields if needed
-    for p in payments_data:
-        if isinstance(p["date"], str):
-            from dateutil.parser import parse
-
-            p["date"] = parse(p["date"])
-    added_payments = add_payments_list(payments_data, db, current_user.id)
-    return [PaymentResponse.from_domain(p) for p in added_payments]
+    # The service reads the validated request models directly
+    try:
+        added_payments = add_payments_list(req.payments, db, current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ORJSONResponse([payment_to_dict(p) for p in added_payments])
 
 
 class ExchangeRateRequest(BaseModel):
@@ -343,8 +452,6 @@ def fetch_exchange_rates_endpoint(
     req: ExchangeRateRequest,
     db: Session = Depends(get_db),
 ):
-    from app.domain.services.payment_service import fetch_and_store_exchange_rates
-
     try:
         fetch_and_store_exchange_rates(db, req.start, req.end)
         return {"status": "success"}
@@ -0,0 +1,63 @@
+import hashlib
+from typing import Any
+
+import orjson
+import ormsgpack
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+    Datetimes are emitted as ISO strings, matching FastAPI's default encoder.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MsgpackResponse(Response):
+    """
+    MessagePack response rendered with ormsgpack.
+    Floats go on the wire as native msgpack types. Datetimes stay naive ISO
+    strings, the same values JSON clients get; payment times are local
+    wall-clock times, not UTC instants.
+    """
+
+    media_type = "application/msgpack"
+
+    def render(self, content: Any) -> bytes:
+        return ormsgpack.packb(content)
+
+
+def wants_msgpack(request: Request) -> bool:
+    return "application/msgpack" in request.headers.get("accept", "")
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in (etag, "*"):
+            return True
+    return False
+
+
+def etag_response(request: Request, content: Any) -> Response:
+    """
+    Render content with orjson and tag it with a hash of the body.
+    Clients sending Accept: application/msgpack get MessagePack instead.
+    Returns an empty 304 when the client already holds this exact body.
+    Clients must revalidate on every use, so edits show up immediately.
+    """
+    response_class = MsgpackResponse if wants_msgpack(request) else ORJSONResponse
+    response = response_class(content)
+    etag = '"' + hashlib.blake2b(response.body, digest_size=16).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
@@ -1,18 +1,24 @@
+import asyncio
 import os
 
-import requests
+import httpx
+from cachetools import TTLCache
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
 
-from app.data.repositories.user_repository import SessionLocal, create_user_table
+from app.data.base import get_db
 from app.domain.services.auth_service import (
+    PasswordHashingBusyError,
     authenticate_user,
     change_password,
     change_username,
     create_access_token,
     delete_user_account,
     get_current_user,
+    is_username_taken,
     register_user,
 )
 
@@ -33,41 +39,92 @@ class ChangePasswordRequest(BaseModel):
     new_password: str
 
 
-def verify_hcaptcha(token: str) -> bool:
+# Shared client, so registrations reuse pooled connections to hCaptcha.
+# Created on first use and closed on application shutdown, see app.main.
+_hcaptcha_client: httpx.AsyncClient | None = None
+
+# Tokens hCaptcha rejected. Tokens are single-use, so only failures are
+# cached; a retried bad submission is answered without another round trip.
+_REJECTED_TOKENS: TTLCache = TTLCache(maxsize=1024, ttl=120)
+
+
+def _get_hcaptcha_client() -> httpx.AsyncClient:
+    global _hcaptcha_client
+    if _hcaptcha_client is None:
+        _hcaptcha_client = httpx.AsyncClient(timeout=5)
+    return _hcaptcha_client
+
+
+async def close_hcaptcha_client() -> None:
+    global _hcaptcha_client
+    if _hcaptcha_client is not None:
+        await _hcaptcha_client.aclose()
+        _hcaptcha_client = None
+
+
+async def verify_hcaptcha(token: str) -> bool:
     secret = os.getenv("HCAPTCHA_SECRET")
     if not secret:
         raise RuntimeError("HCAPTCHA_SECRET environment variable is not set")
-    resp = requests.post(
+    if token in _REJECTED_TOKENS:
+        return False
+    resp = await _get_hcaptcha_client().post(
         "https://hcaptcha.com/siteverify",
         data={"secret": secret, "response": token},
-        timeout=5,
     )
     data = resp.json()
-    return data.get("success", False)
+    success = data.get("success", False)
+    if not success:
+        _REJECTED_TOKENS[token] = True
+    return success
 
 
 @router.post("/register")
-def register_user_endpoint(req: UserCreateRequest):
-    if not verify_hcaptcha(req.hcaptcha_token):
+async def register_user_endpoint(req: UserCreateRequest, db: Session = Depends(get_db)):
+    # The captcha round trip and the username lookup are independent. Wait
+    # for both before raising, so the session isn't closed under the lookup
+    captcha_ok, taken = await asyncio.gather(
+        verify_hcaptcha(req.hcaptcha_token),
+        run_in_threadpool(is_username_taken, db, req.username),
+        return_exceptions=True,
+    )
+    for outcome in (captcha_ok, taken):
+        if isinstance(outcome, BaseException):
+            raise outcome
+    if not captcha_ok:
         raise HTTPException(status_code=400, detail="hCaptcha verification failed")
-    db = SessionLocal()
+    if taken:
+        raise HTTPException(status_code=400, detail="Username already registered")
     try:
-        user = register_user(db, req.username, req.password)
+        user = await run_in_threadpool(register_user, db, req.username, req.password)
     except ValueError as e:
-        db.close()
         raise HTTPException(status_code=400, detail=str(e))
-    db.close()
+    except PasswordHashingBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
     return {"username": user.username}
 
 
 @router.post("/token")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    db = SessionLocal()
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+):
     try:
-        user = authenticate_user(db, form_data.username, form_data.password)
+        # Password hashing is CPU-bound, keep it off the event loop
+        user = await run_in_threadpool(
+            authenticate_user, db, form_data.username, form_data.password
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail="Invalid Username: " + str(e))
-    db.close()
+    except PasswordHashingBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -79,47 +136,49 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 @router.get("/me")
-def read_users_me(current_user=Depends(get_current_user)):
+async def read_users_me(current_user=Depends(get_current_user)):
     return {"username": current_user.username}
 
 
 @router.delete("/delete")
-def delete_current_user(current_user=Depends(get_current_user)):
-    db = SessionLocal()
-    success = delete_user_account(db, current_user.id)
-    db.close()
+async def delete_current_user(
+    db: Session = Depends(get_db), current_user=Depends(get_current_user)
+):
+    success = await run_in_threadpool(delete_user_account, db, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="User not found")
     return {"deleted": True}
 
 
 @router.post("/change-username")
-def change_username_endpoint(
-    req: ChangeUsernameRequest, current_user=Depends(get_current_user)
+async def change_username_endpoint(
+    req: ChangeUsernameRequest,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
 ):
-    db = SessionLocal()
     try:
-        user = change_username(db, current_user.id, req.new_username)
+        user = await run_in_threadpool(
+            change_username, db, current_user.id, req.new_username
+        )
     except ValueError as e:
-        db.close()
         raise HTTPException(status_code=400, detail=str(e))
-    db.close()
     return {"username": user.username}
 
 
 @router.post("/change-password")
-def change_password_endpoint(
-    req: ChangePasswordRequest, current_user=Depends(get_current_user)
+async def change_password_endpoint(
+    req: ChangePasswordRequest,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
 ):
-    db = SessionLocal()
     try:
-        change_password(db, current_user.id, req.new_password)
+        await run_in_threadpool(change_password, db, current_user.id, req.new_password)
     except ValueError as e:
-        db.close()
         raise HTTPException(status_code=400, detail=str(e))
-    db.close()
+    except PasswordHashingBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
     return {"success": True}
-
-
-# Ensure user table exists at startup
-create_user_table()
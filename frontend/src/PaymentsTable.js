@@ -1,4 +1,4 @@
-import React, { useState } from "react";
+import React, { useState, useRef, useCallback, useMemo } from "react";
 import { LocalizationProvider } from "@mui/x-date-pickers/LocalizationProvider";
 import { AdapterDateFns } from "@mui/x-date-pickers/AdapterDateFns";
 import { DragDropContext, Droppable, Draggable } from "@hello-pangea/dnd";
@@ -13,8 +13,6 @@ import {
   TableHead,
   TableRow,
   Button,
-  TextField,
-  InputAdornment,
   Dialog,
   DialogTitle,
   DialogContent,
@@ -23,7 +21,7 @@ import {
   MenuItem,
   Pagination,
 } from "@mui/material";
-import { Search as SearchIcon, Upload as UploadIcon, Settings as SettingsIcon, Close as CloseIcon } from "@mui/icons-material";
+import { Upload as UploadIcon, Settings as SettingsIcon, Close as CloseIcon } from "@mui/icons-material";
 import { fetchAggregation, deletePayments } from "./api";
 import "./PaymentsTable.css";
 
@@ -31,6 +29,7 @@ import "./PaymentsTable.css";
 import { usePayments } from "./hooks/usePayments";
 import { useCategories } from "./hooks/useCategories";
 import { useTableColumns } from "./hooks/useTableColumns";
+import { useVirtualRows } from "./hooks/useVirtualRows";
 
 // Components
 import ManageCategoriesDialog from "./components/ManageCategoriesDialog";
@@ -40,6 +39,7 @@ import AggregationDialog from "./components/AggregationDialog";
 import FileUpload from "./components/FileUpload";
 import SettingsDialog from "./components/SettingsDialog";
 import ConfirmDialog from "./components/ConfirmDialog";
+import SearchBar from "./components/SearchBar";
 
 export default function PaymentsTable() {
   const {
@@ -82,9 +82,11 @@ export default function PaymentsTable() {
   // Selection state
   const [selectedIds, setSelectedIds] = useState([]);
   const [contextMenu, setContextMenu] = useState(null);
+  const selectedIdSet = useMemo(() => new Set(selectedIds), [selectedIds]);
 
   // Use backend data directly
   const displayedPayments = payments;
+  const { containerRef, onScroll, start, end, padTop, padBottom } = useVirtualRows(displayedPayments.length);
 
   // Aggregation dialog state
   const [aggregationOpen, setAggregationOpen] = useState(false);
@@ -174,9 +176,9 @@ export default function PaymentsTable() {
   };
 
   // Context menu handlers
-  const handleRowContextMenu = (payment, event) => {
+  const handleRowContextMenuInner = (payment, event) => {
     event.preventDefault();
-    if (!selectedIds.includes(payment.id)) {
+    if (!selectedIdSet.has(payment.id)) {
       setSelectedIds([payment.id]);
     }
     setContextMenu(
@@ -186,6 +188,18 @@ export default function PaymentsTable() {
     );
   };
 
+  // Rows are memoized, so hand them stable callbacks that forward to the
+  // latest handlers instead of fresh closures on every render
+  const rowHandlersRef = useRef({});
+  rowHandlersRef.current = {
+    categoryChange: handleCategoryChangeWithDialog,
+    rowClick: handleRowClick,
+    rowContextMenu: handleRowContextMenuInner,
+  };
+  const onRowCategoryChange = useCallback((payment, value) => rowHandlersRef.current.categoryChange(payment, value), []);
+  const onRowClick = useCallback((payment, event) => rowHandlersRef.current.rowClick(payment, event), []);
+  const handleRowContextMenu = useCallback((payment, event) => rowHandlersRef.current.rowContextMenu(payment, event), []);
+
   const handleCloseContextMenu = () => {
     setContextMenu(null);
   };
@@ -208,23 +222,11 @@ export default function PaymentsTable() {
     }
   };
 
-  // Search handler: only set local value, don't trigger search
-  const [searchInput, setSearchInput] = useState(search);
-
-  const handleSearchInputChange = (e) => {
-    setSearchInput(e.target.value);
-  };
-
-  const handleSearchSubmit = () => {
-    setSearch(searchInput);
+  // The search input keeps its own state, this only runs once it settles
+  const handleSearch = useCallback((value) => {
+    setSearch(value);
     setPage(1);
-  };
-
-  const handleSearchKeyDown = (e) => {
-    if (e.key === "Enter") {
-      handleSearchSubmit();
-    }
-  };
+  }, [setSearch, setPage]);
 
   const handleSort = (field) => {
     setSort((prev) => {
@@ -361,45 +363,7 @@ React.useEffect(() => {
 
         {/* Search Bar and Upload Button */}
         <Box sx={{ mb: 3, display: 'flex', gap: 2, alignItems: 'center' }}>
-          <TextField
-            fullWidth
-            placeholder="Search transactions..."
-            value={searchInput}
-            onChange={handleSearchInputChange}
-            onKeyDown={handleSearchKeyDown}
-            InputProps={{
-              startAdornment: (
-                <InputAdornment position="start">
-                  <SearchIcon sx={{ color: 'rgba(0,0,0,0.4)' }} />
-                </InputAdornment>
-              ),
-              sx: {
-                borderRadius: '12px',
-                background: 'white',
-                '& .MuiOutlinedInput-notchedOutline': {
-                  borderColor: 'rgba(0,0,0,0.08)',
-                  borderWidth: '2px',
-                },
-                '&:hover .MuiOutlinedInput-notchedOutline': {
-                  borderColor: 'rgba(102,126,234,0.3)',
-                },
-                '&.Mui-focused .MuiOutlinedInput-notchedOutline': {
-                  borderColor: '#667eea',
-                },
-                height: '48px',
-                fontSize: '15px',
-                fontWeight: 500,
-              }
-            }}
-          />
-          <Button
-            variant="contained"
-            startIcon={<SearchIcon />}
-            onClick={handleSearchSubmit}
-            className="btn-primary upload-btn"
-          >
-            Search
-          </Button>
+          <SearchBar search={search} onSearch={handleSearch} />
           <Button
             variant="contained"
             startIcon={<UploadIcon />}
@@ -416,7 +380,7 @@ React.useEffect(() => {
               {total} {total === 1 ? 'item' : 'items'}
             </span>
           </div>
-          <TableContainer sx={{ maxHeight: "65vh", position: "relative" }}>
+          <TableContainer ref={containerRef} onScroll={onScroll} sx={{ maxHeight: "65vh", position: "relative" }}>
             {loading && (
               <Box
                 sx={{
@@ -474,19 +438,29 @@ React.useEffect(() => {
                   </Droppable>
                 </TableHead>
                 <TableBody>
-                  {displayedPayments.map((payment) => (
+                  {padTop > 0 && (
+                    <TableRow className="virtual-spacer" aria-hidden="true" style={{ height: padTop }}>
+                      <TableCell colSpan={visibleColumns.size || 1} />
+                    </TableRow>
+                  )}
+                  {displayedPayments.slice(start, end).map((payment) => (
                     <PaymentTableRow
                       key={payment.id}
                       payment={payment}
                       orderedColumns={orderedColumns}
                       visibleColumns={visibleColumns}
                       categories={categories}
-                      onCategoryChange={handleCategoryChangeWithDialog}
-                      selected={selectedIds.includes(payment.id)}
-                      onRowClick={handleRowClick}
+                      onCategoryChange={onRowCategoryChange}
+                      selected={selectedIdSet.has(payment.id)}
+                      onRowClick={onRowClick}
                       onRowContextMenu={handleRowContextMenu}
                     />
                   ))}
+                  {padBottom > 0 && (
+                    <TableRow className="virtual-spacer" aria-hidden="true" style={{ height: padBottom }}>
+                      <TableCell colSpan={visibleColumns.size || 1} />
+                    </TableRow>
+                  )}
                   {displayedPayments.length === 0 && (
                     <TableRow>
                       <TableCell colSpan={visibleColumns.size || 1} className="empty-state">
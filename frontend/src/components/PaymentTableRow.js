@@ -1,4 +1,4 @@
-import React from "react";
+import React, { useMemo } from "react";
 import {
   TableRow,
   TableCell,
@@ -13,7 +13,7 @@ import {
 } from "@mui/material";
 import { format } from "date-fns";
 
-export default function PaymentTableRow({
+function PaymentTableRow({
   payment,
   orderedColumns,
   visibleColumns,
@@ -42,6 +42,16 @@ export default function PaymentTableRow({
     }
   };
 
+  // Parse and format the date once per payment rather than on every render
+  const dateParts = useMemo(() => {
+    const d = new Date(payment.date);
+    return {
+      day: format(d, "dd"),
+      monthYear: format(d, "MMM yyyy"),
+      weekdayTime: format(d, "EEE, HH:mm"),
+    };
+  }, [payment.date]);
+
   const t = payment.type?.toLowerCase();
   const isAbortType = isAbort(t);
   const isPos = isPositive(t);
@@ -67,14 +77,14 @@ export default function PaymentTableRow({
                   fontWeight: 700,
                 }}
               >
-                {format(new Date(payment.date), "dd")}
+                {dateParts.day}
               </Avatar>
               <Box>
                 <Typography variant="body2" sx={{ fontWeight: 700 }}>
-                  {format(new Date(payment.date), "MMM yyyy")}
+                  {dateParts.monthYear}
                 </Typography>
                 <Typography variant="caption" color="text.secondary">
-                  {format(new Date(payment.date), "EEE")}, {format(new Date(payment.date), "HH:mm")}
+                  {dateParts.weekdayTime}
                 </Typography>
               </Box>
             </Stack>
@@ -211,6 +221,7 @@ export default function PaymentTableRow({
   return (
     <TableRow
       key={payment.id}
+      data-virtual-row
       hover
       selected={selected}
       sx={selected ? { backgroundColor: "rgba(102,126,234,0.08) !important" } : {}}
@@ -224,4 +235,8 @@ export default function PaymentTableRow({
       })}
     </TableRow>
   );
-}
\ No newline at end of file
+}
+
+// Re-render a row only when its own props change, so sorting, selection and
+// category edits touch just the affected rows
+export default React.memo(PaymentTableRow);
@@ -0,0 +1,80 @@
+import React, { useState, useEffect } from "react";
+import { Button, TextField, InputAdornment } from "@mui/material";
+import { Search as SearchIcon } from "@mui/icons-material";
+
+// Wait this long after the last keystroke before searching
+const SEARCH_DEBOUNCE_MS = 300;
+// Shorter queries only search on Enter / button, they match too much to be useful
+const MIN_AUTO_SEARCH_LENGTH = 3;
+
+// Keeps the input value in local state so typing doesn't re-render the table
+export default function SearchBar({ search, onSearch }) {
+  const [searchInput, setSearchInput] = useState(search);
+
+  // Follow changes made by the parent, e.g. when it clears or resets the search
+  useEffect(() => {
+    setSearchInput(search);
+  }, [search]);
+
+  useEffect(() => {
+    const query = searchInput.trim();
+    if (query === search.trim()) return;
+    if (query.length > 0 && query.length < MIN_AUTO_SEARCH_LENGTH) return;
+    const timer = setTimeout(() => onSearch(searchInput), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [searchInput, search, onSearch]);
+
+  const handleSearchSubmit = () => {
+    onSearch(searchInput);
+  };
+
+  const handleSearchKeyDown = (e) => {
+    if (e.key === "Enter") {
+      handleSearchSubmit();
+    }
+  };
+
+  return (
+    <>
+      <TextField
+        fullWidth
+        placeholder="Search transactions..."
+        value={searchInput}
+        onChange={(e) => setSearchInput(e.target.value)}
+        onKeyDown={handleSearchKeyDown}
+        InputProps={{
+          startAdornment: (
+            <InputAdornment position="start">
+              <SearchIcon sx={{ color: 'rgba(0,0,0,0.4)' }} />
+            </InputAdornment>
+          ),
+          sx: {
+            borderRadius: '12px',
+            background: 'white',
+            '& .MuiOutlinedInput-notchedOutline': {
+              borderColor: 'rgba(0,0,0,0.08)',
+              borderWidth: '2px',
+            },
+            '&:hover .MuiOutlinedInput-notchedOutline': {
+              borderColor: 'rgba(102,126,234,0.3)',
+            },
+            '&.Mui-focused .MuiOutlinedInput-notchedOutline': {
+              borderColor: '#667eea',
+            },
+            height: '48px',
+            fontSize: '15px',
+            fontWeight: 500,
+          }
+        }}
+      />
+      <Button
+        variant="contained"
+        startIcon={<SearchIcon />}
+        onClick={handleSearchSubmit}
+        className="btn-primary upload-btn"
+      >
+        Search
+      </Button>
+    </>
+  );
+}
@@ -0,0 +1,46 @@
+import { useState, useRef, useCallback, useLayoutEffect } from "react";
+
+// Windowed rendering for a scrollable table body: only rows in the viewport
+// (plus a small overscan buffer) are mounted, spacer rows keep the scroll height.
+export function useVirtualRows(count, { estimatedRowHeight = 72, overscan = 6 } = {}) {
+  const containerRef = useRef(null);
+  const frameRef = useRef(0);
+  const [rowHeight, setRowHeight] = useState(estimatedRowHeight);
+  const [scrollTop, setScrollTop] = useState(0);
+  const [viewportHeight, setViewportHeight] = useState(0);
+
+  const onScroll = useCallback(() => {
+    if (frameRef.current) return;
+    frameRef.current = requestAnimationFrame(() => {
+      frameRef.current = 0;
+      const el = containerRef.current;
+      if (el) setScrollTop(el.scrollTop);
+    });
+  }, []);
+
+  useLayoutEffect(() => {
+    const el = containerRef.current;
+    if (!el) return;
+    setViewportHeight(el.clientHeight);
+    // Use the real height of a rendered row so the spacers don't drift
+    const row = el.querySelector("tbody tr[data-virtual-row]");
+    if (row && row.offsetHeight && row.offsetHeight !== rowHeight) {
+      setRowHeight(row.offsetHeight);
+    }
+  });
+
+  useLayoutEffect(() => () => cancelAnimationFrame(frameRef.current), []);
+
+  const visibleCount = Math.ceil((viewportHeight || rowHeight * 10) / rowHeight);
+  const start = Math.min(Math.max(0, Math.floor(scrollTop / rowHeight) - overscan), count);
+  const end = Math.min(count, start + visibleCount + overscan * 2);
+
+  return {
+    containerRef,
+    onScroll,
+    start,
+    end,
+    padTop: start * rowHeight,
+    padBottom: (count - end) * rowHeight,
+  };
+}
@@ -0,0 +1,36 @@
+import uuid
+
+import pytest
+from sqlalchemy.orm import Session
+
+
+@pytest.fixture
+def db():
+    """
+    Session on the configured database whose work is rolled back afterwards.
+    Repository commits only release a savepoint inside the outer transaction.
+    """
+    try:
+        from app.data.base import engine
+        from app.data.setup_db import create_tables
+    except RuntimeError as e:
+        pytest.skip(str(e))
+    if engine.dialect.name != "postgresql":
+        pytest.skip("database tests need PostgreSQL")
+    create_tables()
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+
+@pytest.fixture
+def user(db):
+    from app.data.repositories.user_repository import create_user
+
+    return create_user(db, f"t-{uuid.uuid4().hex[:10]}", "not-a-real-hash")
@@ -0,0 +1,180 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.data.repositories.currency_repository import set_currency_rates
+from app.data.repositories.payment_repository import (
+    get_all_payments,
+    sum_payments_in_db_range,
+    sum_payments_in_db_ranges,
+    upsert_payment_batches,
+    upsert_payments,
+)
+from app.data.repositories.user_repository import create_user
+from app.domain.models.payment import Payment, PaymentSource, PaymentType
+
+EURO_RATE = 0.125
+
+
+def make_payment(when, amount, currency="CNY", merchant="Shop", payment_type=None):
+    return Payment(
+        date=when,
+        amount=amount,
+        currency=currency,
+        merchant=merchant,
+        source=PaymentSource.OTHER,
+        type=payment_type or PaymentType.EXPENSE,
+    )
+
+
+@pytest.fixture
+def payments(db, user):
+    rows = [
+        make_payment(datetime(1999, 1, 5, 9), -100.0),
+        make_payment(datetime(1999, 1, 20, 18), -8.0, currency="EUR"),
+        make_payment(
+            datetime(1999, 1, 31, 23, 59), 40.0, payment_type=PaymentType.INCOME
+        ),
+        make_payment(datetime(1999, 2, 1, 12), -30.0),
+        make_payment(datetime(1999, 2, 2, 7), -500.0, payment_type=PaymentType.ABORT),
+        make_payment(datetime(1999, 2, 3, 10), -2.0, currency="EUR"),
+    ]
+    for p in rows:
+        set_currency_rates(db, p.date, EURO_RATE, 1.0, 1.0, 1.0, 1.0, 1.0)
+    upsert_payments(db, rows, user.id)
+    return rows
+
+
+def reference_sum(payments, start, end, currency):
+    """Plain Python version of the conversion the SQL sums perform."""
+    total = 0.0
+    for p in payments:
+        if p.type is PaymentType.ABORT:
+            continue
+        if (start and p.date < start) or (end and p.date > end):
+            continue
+        in_cny = p.amount / EURO_RATE if p.currency == "EUR" else p.amount
+        total += in_cny * EURO_RATE if currency == "EUR" else in_cny
+    return total
+
+
+@pytest.mark.parametrize("currency", [None, "EUR"])
+def test_sum_payments_in_db_ranges_matches_single_range_sums(
+    db, user, payments, currency
+):
+    ranges = {
+        "total": (None, None, None),
+        "january": (datetime(1999, 1, 1), datetime(1999, 1, 31, 23, 59, 59), None),
+        "from_february": (datetime(1999, 2, 1), None, None),
+        "until_mid_january": (None, datetime(1999, 1, 15), None),
+        "last_3_days": (None, None, 3),
+        "empty": (datetime(1998, 1, 1), datetime(1998, 1, 2), None),
+    }
+
+    sums = sum_payments_in_db_ranges(db, user.id, ranges, currency=currency)
+
+    assert set(sums) == set(ranges)
+    for name, (start, end, days) in ranges.items():
+        single = sum_payments_in_db_range(db, user.id, start, end, currency, days)
+        assert sums[name] == pytest.approx(single), name
+    # The days window runs from midnight two days before the newest payment
+    window_start = datetime(1999, 2, 1)
+    for name, start, end in [
+        ("total", None, None),
+        ("january", *ranges["january"][:2]),
+        ("from_february", datetime(1999, 2, 1), None),
+        ("until_mid_january", None, datetime(1999, 1, 15)),
+        ("last_3_days", window_start, None),
+    ]:
+        expected = reference_sum(payments, start, end, currency)
+        assert sums[name] == pytest.approx(expected), name
+    assert sums["empty"] == 0.0
+
+
+def test_sum_payments_in_db_ranges_drops_bound_offsets(db, user, payments):
+    # Bounds are compared by their wall-clock time, like the sankey filters;
+    # shifted to UTC the start would take in the 18:00 payment
+    aware = timezone(timedelta(hours=8))
+    ranges = {
+        "aware": (
+            datetime(1999, 1, 20, 20, tzinfo=aware),
+            datetime(1999, 2, 1, 10, tzinfo=aware),
+            None,
+        ),
+        "naive": (datetime(1999, 1, 20, 20), datetime(1999, 2, 1, 10), None),
+    }
+
+    sums = sum_payments_in_db_ranges(db, user.id, ranges)
+
+    assert sums["aware"] == pytest.approx(sums["naive"])
+    assert sums["naive"] == pytest.approx(
+        reference_sum(payments, *ranges["naive"][:2], None)
+    )
+
+
+def test_sum_payments_in_db_ranges_without_payments(db, user):
+    ranges = {"total": (None, None, None), "last_7_days": (None, None, 7)}
+
+    assert sum_payments_in_db_ranges(db, user.id, ranges) == {
+        "total": 0.0,
+        "last_7_days": 0.0,
+    }
+    assert sum_payments_in_db_ranges(db, user.id, {}) == {}
+
+
+def test_upsert_payment_batches_skips_existing_payments(db, user):
+    first = make_payment(datetime(1999, 3, 1, 8), -1.0, merchant="Bakery")
+    second = make_payment(datetime(1999, 3, 2, 8), -2.0, merchant="Cafe")
+    third = make_payment(datetime(1999, 3, 3, 8), -3.0, merchant="Kiosk")
+    fourth = make_payment(datetime(1999, 3, 4, 8), -4.0, merchant="Market")
+    for p in (first, second, third, fourth):
+        set_currency_rates(db, p.date, EURO_RATE, 1.0, 1.0, 1.0, 1.0, 1.0)
+
+    assert upsert_payments(db, [first, second], user.id) == 2
+    # Rows from earlier calls and from earlier batches both count as existing
+    assert upsert_payment_batches(db, [[first, third], [third, fourth]], user.id) == [
+        1,
+        1,
+    ]
+    assert upsert_payment_batches(db, [[second], [], [fourth]], user.id) == [0, 0, 0]
+    assert upsert_payment_batches(db, [], user.id) == []
+
+    payments, total = get_all_payments(db, user.id, page_size=10)
+    assert total == 4
+    assert sorted(p.merchant for p in payments) == ["Bakery", "Cafe", "Kiosk", "Market"]
+
+
+def test_upsert_payments_only_matches_the_same_user(db, user):
+    other = create_user(db, f"{user.username}-b", "not-a-real-hash")
+    payment = make_payment(datetime(1999, 3, 1, 8), -1.0)
+    set_currency_rates(db, payment.date, EURO_RATE, 1.0, 1.0, 1.0, 1.0, 1.0)
+
+    assert upsert_payments(db, [payment], other.id) == 1
+    assert upsert_payments(db, [payment], user.id) == 1
+    assert upsert_payments(db, [payment], user.id) == 0
+
+
+def test_get_all_payments_reports_total_on_every_page(db, user, payments):
+    # ABORT payments are listed too, only the sums skip them
+    listed_ids = []
+    pages = []
+    for page in range(1, 5):
+        rows, total = get_all_payments(db, user.id, page=page, page_size=2)
+        assert total == len(payments)
+        pages.append(len(rows))
+        listed_ids.extend(p.id for p in rows)
+
+    assert pages == [2, 2, 2, 0]
+    assert len(set(listed_ids)) == len(payments)
+    newest_first = [p.date for p in payments][::-1]
+    listed, _ = get_all_payments(db, user.id, page_size=10)
+    assert [p.date for p in listed] == newest_first
+
+
+def test_get_all_payments_total_follows_search(db, user, payments):
+    rows, total = get_all_payments(db, user.id, page_size=1, search="shop")
+    assert total == len(payments)
+    assert len(rows) == 1
+
+    rows, total = get_all_payments(db, user.id, page=3, search="no such merchant")
+    assert (rows, total) == ([], 0)
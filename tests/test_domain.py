@@ -0,0 +1,193 @@
+import random
+
+import pytest
+from fastapi import HTTPException
+
+from app.domain.helpers.aggregation import build_sankey_data
+
+
+def reference_sankey(result, metadata, category_tree):
+    """
+    The original recursive builder: add every node, then drop zero-valued
+    nodes and the links touching them, remapping indices.
+    """
+    nodes, node_map, links = [], {}, []
+
+    def add_node(name):
+        if name not in node_map:
+            if name == "Total Expenses":
+                value = metadata["Total Expenses"]
+            else:
+                value = result.get(name, 0)
+            node_map[name] = len(nodes)
+            nodes.append({"name": name, "value": value})
+        return node_map[name]
+
+    def add_link(parent, child, value):
+        if value > 0:
+            links.append({"source": parent, "target": child, "value": value})
+        elif value < 0:
+            links.append({"source": child, "target": parent, "value": abs(value)})
+
+    def traverse(tree, parent):
+        for k, v in tree.items() if isinstance(tree, dict) else []:
+            add_link(node_map[parent], add_node(k), result.get(k, 0))
+            traverse(v, k)
+
+    add_node("Total Expenses")
+    traverse(category_tree or {}, "Total Expenses")
+    for special in ["no category", "invalid category"]:
+        if result.get(special, 0) != 0:
+            add_link(node_map["Total Expenses"], add_node(special), result[special])
+
+    kept = [n for n in nodes if n["value"] != 0]
+    new_idx = {node_map[n["name"]]: i for i, n in enumerate(kept)}
+    return {
+        "nodes": kept,
+        "links": [
+            {
+                "source": new_idx[link["source"]],
+                "target": new_idx[link["target"]],
+                "value": link["value"],
+            }
+            for link in links
+            if link["source"] in new_idx and link["target"] in new_idx
+        ],
+    }
+
+
+def test_build_sankey_data_links_and_drops_zero_nodes():
+    tree = {"Food": {"Groceries": None, "Restaurants": {}}, "Rent": None}
+    result = {"Food": 0, "Groceries": 30, "Restaurants": -30, "Rent": 50}
+    result["no category"] = 5
+
+    data = build_sankey_data(result, {"Total Expenses": 55}, tree)
+
+    assert data["nodes"] == [
+        {"name": "Total Expenses", "value": 55},
+        {"name": "Groceries", "value": 30},
+        {"name": "Restaurants", "value": -30},
+        {"name": "Rent", "value": 50},
+        {"name": "no category", "value": 5},
+    ]
+    # Children of the zero-valued Food node stay, their links to it go
+    assert data["links"] == [
+        {"source": 0, "target": 3, "value": 50},
+        {"source": 0, "target": 4, "value": 5},
+    ]
+
+
+def test_build_sankey_data_matches_reference_builder():
+    rng = random.Random(7)
+    names = [f"c{i}" for i in range(8)]
+    names += ["no category", "invalid category", "Total Expenses"]
+
+    def random_tree(depth):
+        if depth == 0 or rng.random() < 0.3:
+            return rng.choice([None, {}, "leaf"])
+        return {rng.choice(names): random_tree(depth - 1) for _ in range(3)}
+
+    for _ in range(2000):
+        tree = random_tree(4)
+        if not isinstance(tree, dict):
+            tree = None
+        result = {n: rng.choice([0, 0, 4, -3, 7.5]) for n in rng.sample(names, 6)}
+        metadata = {"Total Expenses": rng.choice([0, 10, -4])}
+
+        assert build_sankey_data(result, metadata, tree) == reference_sankey(
+            result, metadata, tree
+        )
+
+
+@pytest.fixture
+def auth_service(db):
+    try:
+        from app.domain.services import auth_service
+    except RuntimeError as e:
+        pytest.skip(str(e))
+    auth_service._TOKEN_CACHE.clear()
+    yield auth_service
+    auth_service._TOKEN_CACHE.clear()
+
+
+def test_token_cache_hit_skips_the_database(auth_service, db, user):
+    token = auth_service.create_access_token({"sub": user.username})
+
+    first = auth_service.get_current_user(token, db)
+    # A hit answers without touching the session
+    cached = auth_service.get_current_user(token, None)
+
+    assert cached is first
+    assert (cached.id, cached.username) == (user.id, user.username)
+    assert cached.hashed_password is None
+
+
+def test_token_cache_is_invalidated_on_password_change(auth_service, db, user):
+    token = auth_service.create_access_token({"sub": user.username})
+    first = auth_service.get_current_user(token, db)
+
+    auth_service.change_password(db, user.id, "a new password")
+
+    assert token not in auth_service._TOKEN_CACHE
+    assert auth_service.get_current_user(token, db) is not first
+
+
+def test_token_cache_is_invalidated_on_username_change(auth_service, db, user):
+    token = auth_service.create_access_token({"sub": user.username})
+    auth_service.get_current_user(token, db)
+
+    auth_service.change_username(db, user.id, "renamed-" + user.username[-6:])
+
+    with pytest.raises(HTTPException) as exc:
+        auth_service.get_current_user(token, db)
+    assert exc.value.status_code == 401
+
+
+def test_token_lookup_overlapping_an_account_change_is_not_cached(
+    auth_service, db, user, monkeypatch
+):
+    token = auth_service.create_access_token({"sub": user.username})
+    lookup = auth_service.get_user_by_username
+
+    def lookup_racing_a_password_change(db, username):
+        found = lookup(db, username)
+        auth_service._invalidate_user_tokens(found.id)
+        return found
+
+    monkeypatch.setattr(
+        auth_service, "get_user_by_username", lookup_racing_a_password_change
+    )
+
+    assert auth_service.get_current_user(token, db).id == user.id
+    assert token not in auth_service._TOKEN_CACHE
+
+
+def test_token_cache_is_invalidated_on_account_deletion(auth_service, db, user):
+    token = auth_service.create_access_token({"sub": user.username})
+    auth_service.get_current_user(token, db)
+
+    auth_service.delete_user_account(db, user.id)
+
+    with pytest.raises(HTTPException) as exc:
+        auth_service.get_current_user(token, db)
+    assert exc.value.status_code == 401
+
+
+def test_category_tree_fetched_during_an_update_is_not_cached(db, user, monkeypatch):
+    from app.domain.services import payment_service
+
+    old_tree = {"Food": None}
+
+    def fetch_racing_an_update(db, user_id):
+        # update_category_tree commits and invalidates while this read runs
+        payment_service._invalidate_tree(user_id)
+        return old_tree
+
+    monkeypatch.setattr(
+        payment_service, "repo_get_category_tree", fetch_racing_an_update
+    )
+
+    assert payment_service.get_category_tree(db, user.id) is old_tree
+    assert payment_service.get_category_tree_json(db, user.id) == b'{"Food":null}'
+    assert user.id not in payment_service._TREE_CACHE
+    assert user.id not in payment_service._TREE_JSON_CACHE